@@ -0,0 +1,210 @@
+"""
+Answer a file of questions offline through the same retrieval and answer path
+as the chatbot (`utils.retrieve_and_format_response` with the app's patient
+education prompt from prompts.py).
+
+Questions are read from a text file (one per line) or a JSONL file with a
+`question` field and an optional `id`. Work runs on a thread pool under
+per-provider request/token limits, failed questions are retried with backoff,
+and every result is appended to the output JSONL as soon as it is ready. The
+output doubles as the checkpoint: re-running with the same output file skips
+every question that already has an answer and retries the ones that failed.
+When a run starts and when it finishes the file is rewritten with only the
+latest record per id, so a retried question does not keep its old failure
+next to its answer. (A file from a run that was interrupted can still hold
+both; take the last record per id.)
+
+Example:
+    python batch-qa.py questions.txt answers.jsonl --workers 16 --openai-rpm 500 --openai-tpm 30000
+    python batch-qa.py questions.txt answers.jsonl --dry-run   # local stand-ins, no API keys
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from prompts import PATIENT_EDUCATION_PROMPT
+from ratelimit import RateLimiter, RateLimitedChatModel, RateLimitedEmbeddings, retry_with_backoff
+from utils import retrieve_and_format_response
+
+# Ignore all warnings
+warnings.filterwarnings("ignore")
+
+
+def load_questions(path):
+    """Returns a list of (id, question) tuples."""
+    questions = []
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                questions.append((str(record.get("id", line_number)), record["question"]))
+            else:
+                questions.append((str(line_number), line))
+    return questions
+
+
+def load_completed_ids(path):
+    """IDs that already have an answer in a previous run's output."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if record.get("error") is None:
+                completed.add(record["id"])
+    return completed
+
+
+def compact_output(path):
+    """Rewrite the output with only the latest record per id, in first-seen order."""
+    if not os.path.exists(path):
+        return
+    latest = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[record["id"]] = record
+    # Write aside and swap, so an interruption here cannot lose the checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        for record in latest.values():
+            file.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+
+
+def build_live_stack(args, llm_limiter, embed_limiter):
+    import boto3
+    from langchain_openai import ChatOpenAI
+    from langchain_voyageai import VoyageAIEmbeddings
+
+    from federated_retriever import build_retriever
+
+    embeddings = RateLimitedEmbeddings(VoyageAIEmbeddings(
+        model="voyage-large-2",
+        voyage_api_key=os.environ["VOYAGE_AI_API_KEY"]
+    ), embed_limiter)
+    # Same setup as simple-app.py: several indexes are searched in parallel and merged
+    retriever = build_retriever(args.index_name, embeddings, k=args.k, max_concurrency=args.workers)
+    # Retries are handled here, with backoff shared across the whole batch
+    llm = ChatOpenAI(model=args.model, openai_api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+    return retriever, RateLimitedChatModel(llm, llm_limiter), boto3.client("s3")
+
+
+def build_dry_run_stack(args, llm_limiter, embed_limiter):
+    from benchmark import build_corpus
+    from fakes import FakeChatModel, FakeEmbeddings, FakeS3Client, FakeVectorStore
+
+    texts, metadatas, _ = build_corpus(200)
+    embeddings = FakeEmbeddings(dim=256, latency=0.0)
+    docsearch = FakeVectorStore.from_texts(texts, embeddings, metadatas=metadatas)
+    embeddings.latency = 0.05
+    docsearch._embedding = RateLimitedEmbeddings(embeddings, embed_limiter)
+    llm = RateLimitedChatModel(FakeChatModel(latency=0.2), llm_limiter)
+    return docsearch.as_retriever(search_kwargs={"k": args.k}), llm, FakeS3Client()
+
+
+def run_batch(questions, output_path, retriever, llm, s3_client, workers=8, retries=5,
+              prompt_template=PATIENT_EDUCATION_PROMPT):
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0}
+
+    def answer(question_id, question):
+        attempts = []
+        start = time.perf_counter()
+
+        def attempt():
+            attempts.append(1)
+            return retrieve_and_format_response(
+                question, retriever, llm, s3_client=s3_client, prompt_template=prompt_template
+            )["answer"]
+
+        def on_retry(attempt_number, error, delay):
+            print(f"[{question_id}] attempt {attempt_number} failed ({error!r}), retrying in {delay:.1f}s")
+
+        record = {"id": question_id, "question": question}
+        try:
+            record["answer"] = retry_with_backoff(attempt, retries=retries, on_retry=on_retry)
+            record["error"] = None
+        except Exception as e:
+            record["answer"] = None
+            record["error"] = repr(e)
+        record["attempts"] = len(attempts)
+        record["latency_ms"] = round(1000 * (time.perf_counter() - start), 1)
+        return record
+
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(answer, question_id, question) for question_id, question in questions]
+        for future in as_completed(futures):
+            record = future.result()
+            # Checkpoint each answer as soon as it is ready
+            with write_lock:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            counts["ok" if record["error"] is None else "failed"] += 1
+            done = counts["ok"] + counts["failed"]
+            print(f"{done}/{len(questions)} done ({counts['failed']} failed)", end="\r")
+    print()
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions through the RAG pipeline.")
+    parser.add_argument("input", help="Questions: .txt with one per line, or .jsonl with a `question` field")
+    parser.add_argument("output", help="Results JSONL; also used as the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--index-name", default="drugbank",
+                        help="Pinecone index, or a comma-separated list of index[:namespace] like vo_index_name")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--openai-rpm", type=int, default=500, help="OpenAI requests per minute")
+    parser.add_argument("--openai-tpm", type=int, default=30000, help="OpenAI tokens per minute")
+    parser.add_argument("--voyage-rpm", type=int, default=300, help="Voyage AI requests per minute")
+    parser.add_argument("--voyage-tpm", type=int, default=1000000, help="Voyage AI tokens per minute")
+    parser.add_argument("--dry-run", action="store_true", help="Use the local stand-ins from fakes.py")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    questions = load_questions(args.input)
+    # Also drops a partial last line left by a killed run, which new records would be appended to
+    compact_output(args.output)
+    completed = load_completed_ids(args.output)
+    pending = [(question_id, question) for question_id, question in questions if question_id not in completed]
+    print(f"{len(questions)} questions, {len(completed)} already answered, {len(pending)} to go")
+    if not pending:
+        return 0
+
+    llm_limiter = RateLimiter("openai", requests_per_minute=args.openai_rpm, tokens_per_minute=args.openai_tpm)
+    embed_limiter = RateLimiter("voyage", requests_per_minute=args.voyage_rpm, tokens_per_minute=args.voyage_tpm)
+    build_stack = build_dry_run_stack if args.dry_run else build_live_stack
+    retriever, llm, s3_client = build_stack(args, llm_limiter, embed_limiter)
+
+    start = time.perf_counter()
+    counts = run_batch(pending, args.output, retriever, llm, s3_client, workers=args.workers, retries=args.retries)
+    elapsed = time.perf_counter() - start
+    compact_output(args.output)
+    print(f"Answered {counts['ok']} questions in {elapsed:.1f}s ({counts['ok'] / elapsed:.2f}/s), {counts['failed']} failed")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Stage-level latency benchmark for the query path.
+
+Runs `utils.retrieve_and_format_response` and the conversational chain from
+`chat-retrieval-chain.py` against the local stand-ins in `fakes.py`, with N
+simulated users in parallel, and reports p50/p95/p99 latency per stage plus
+overall throughput.
+
+Example:
+    python benchmark.py --users 8 --requests 20 --llm-latency 0.4 --json results.json
+"""
+import argparse
+import contextvars
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeChatModel, FakeEmbeddings, FakeS3Client, FakeVectorStore
+from metadata_filters import DRUG_CATEGORIES
+from request_pool import RequestPool, normalize_query
+from utils import retrieve_and_format_response
+
+# Ignore all warnings
+warnings.filterwarnings("ignore")
+
+BENCH_BUCKET = "bench-bucket"
+
+QUERY_TEMPLATES = [
+    "What is {name} used for?",
+    "What are the side effects of {name}?",
+    "How does {name} work?",
+    "Which drugs are {category}?",
+]
+
+STAGES = ["embed", "search", "sign", "llm", "other", "total"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class StageRecorder:
+    """Collects per-request stage timings reported by the fakes' `stage_hook`."""
+
+    def __init__(self):
+        # A context variable rather than a thread local, because LangChain runs
+        # parts of a chain on its own executor threads with a copy of the context
+        self._stages = contextvars.ContextVar("benchmark_stages", default=None)
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def __call__(self, stage, seconds):
+        stages = self._stages.get()
+        if stages is not None:
+            with self._lock:
+                stages[stage] += seconds
+
+    def start(self):
+        self._stages.set(defaultdict(float))
+
+    def finish(self, total):
+        stages = self._stages.get()
+        self._stages.set(None)
+        # Whatever the fakes did not account for is prompt assembly and framework overhead
+        stages["other"] = max(total - sum(stages.values()), 0.0)
+        stages["total"] = total
+        with self._lock:
+            for stage in STAGES:
+                self.samples[stage].append(stages.get(stage, 0.0))
+
+
+def build_corpus(n_docs):
+    """Synthetic DrugBank-style staging chunks with S3 URIs in `metadata['id']`."""
+    texts, metadatas, drugs = [], [], []
+    for i in range(n_docs):
+        drug_id = f"DB{i:05d}"
+        name = f"Drug{i:05d}"
+        category = DRUG_CATEGORIES[i % len(DRUG_CATEGORIES)]
+        text = (
+            f"DrugBank ID: {drug_id}\nName: {name}\nDrug Categories: {category}\n"
+            f"Description: {name} belongs to the {category} group. It is used for conditions "
+            f"treated by {category.lower()} and may cause side effects such as nausea or headache."
+        )
+        texts.append(text)
+        metadatas.append({
+            "id": f"s3://{BENCH_BUCKET}/staging/{drug_id}_parag_00000.json",
+            # Same fields the ingestion Lambda attaches, so metadata pre-filtering is exercised
+            "drug_categories": [category],
+            "doc_type": "txt",
+            "collection": "drugbank",
+        })
+        drugs.append((name, category))
+    return texts, metadatas, drugs
+
+
+def build_queries(drugs, n_queries):
+    queries = []
+    for i in range(n_queries):
+        name, category = drugs[(i * 7) % len(drugs)]
+        template = QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)]
+        queries.append(template.format(name=name, category=category))
+    return queries
+
+
+def build_stack(args, recorder):
+    embeddings = FakeEmbeddings(dim=args.dim, latency=args.embed_latency, stage_hook=recorder)
+    texts, metadatas, drugs = build_corpus(args.docs)
+    # Index the corpus without paying the simulated embedding delay
+    embeddings.latency, embeddings.stage_hook = 0.0, None
+    vector_store = FakeVectorStore.from_texts(
+        texts, embeddings, metadatas=metadatas, latency=args.search_latency, stage_hook=recorder
+    )
+    embeddings.latency, embeddings.stage_hook = args.embed_latency, recorder
+    llm = FakeChatModel(
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        stage_hook=recorder,
+    )
+    s3_client = FakeS3Client(sign_latency=args.sign_latency, stage_hook=recorder)
+    return vector_store, llm, s3_client, build_queries(drugs, args.queries)
+
+
+def load_chat_retrieval_chain():
+    # The script name has a dash in it, so load it from its path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat-retrieval-chain.py")
+    spec = importlib.util.spec_from_file_location("chat_retrieval_chain", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_rag_pipeline(vector_store, llm, s3_client, k):
+    retriever = vector_store.as_retriever(search_kwargs={"k": k})
+
+    def run(query, session_id):
+        return retrieve_and_format_response(query, retriever, llm, s3_client=s3_client)["answer"]
+    return run
+
+
+def make_pooled_pipeline(pipeline, request_pool):
+    """Runs `pipeline` through a shared RequestPool, as simple-app.py does."""
+    def run(query, session_id):
+        return request_pool.run(normalize_query(query), pipeline, query, session_id)
+    return run
+
+
+def make_chain_pipeline(vector_store, llm, k):
+    chat_module = load_chat_retrieval_chain()
+    retriever = vector_store.as_retriever(search_kwargs={"k": k})
+    chain = chat_module.build_conversational_rag_chain(llm, retriever)
+
+    def run(query, session_id):
+        config = {"configurable": {"session_id": session_id}}
+        return chain.invoke({"input": query}, config=config)["answer"]
+    return run
+
+
+def run_load(pipeline, queries, recorder, users, requests_per_user):
+    """Run `requests_per_user` queries for each of `users` concurrent sessions."""
+    errors = []
+
+    def user_session(user_index):
+        # Each simulated user gets its own chat history
+        session_id = str(uuid.uuid4())
+        for j in range(requests_per_user):
+            query = queries[(user_index * requests_per_user + j) % len(queries)]
+            recorder.start()
+            start = time.perf_counter()
+            try:
+                pipeline(query, session_id)
+            except Exception as e:
+                errors.append(e)
+            recorder.finish(time.perf_counter() - start)
+
+    # Warm up imports and lazy initialisation outside the measured run
+    pipeline(queries[0], str(uuid.uuid4()))
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(user_session, range(users)))
+    wall_time = time.perf_counter() - wall_start
+    return wall_time, errors
+
+
+def summarize(name, recorder, wall_time, errors, users):
+    completed = len(recorder.samples["total"])
+    summary = {
+        "pipeline": name,
+        "users": users,
+        "requests": completed,
+        "errors": len(errors),
+        "wall_time_s": wall_time,
+        "throughput_rps": completed / wall_time if wall_time else 0.0,
+        "stages": {},
+    }
+    for stage in STAGES:
+        values = recorder.samples[stage]
+        summary["stages"][stage] = {
+            "p50_ms": 1000 * percentile(values, 50),
+            "p95_ms": 1000 * percentile(values, 95),
+            "p99_ms": 1000 * percentile(values, 99),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\nPipeline: {summary['pipeline']}  users: {summary['users']}  requests: {summary['requests']}  "
+          f"errors: {summary['errors']}  throughput: {summary['throughput_rps']:.2f} req/s")
+    print(f"{'stage':<8}{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}")
+    for stage, stats in summary["stages"].items():
+        print(f"{stage:<8}{stats['p50_ms']:>12.1f}{stats['p95_ms']:>12.1f}{stats['p99_ms']:>12.1f}")
+    if "pool" in summary:
+        pool = summary["pool"]
+        print(f"pool: {pool['completed']} computed, {pool['coalesced']} coalesced, {pool['rejected']} rejected")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the query path against local stand-ins.")
+    parser.add_argument("--pipeline", choices=["rag", "chain", "all"], default="all")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per user")
+    parser.add_argument("--docs", type=int, default=200, help="Documents in the fake index")
+    parser.add_argument("--queries", type=int, default=50, help="Distinct benchmark queries")
+    parser.add_argument("--k", type=int, default=4, help="Documents retrieved per query")
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.03)
+    parser.add_argument("--sign-latency", type=float, default=0.0)
+    parser.add_argument("--pool-workers", type=int,
+                        help="Run the rag pipeline through a request_pool.RequestPool with this many workers")
+    parser.add_argument("--pool-queue", type=int, default=64, help="Queue size for --pool-workers")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float,
+                        help="Exit with status 1 if any pipeline's total p95 is above this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pipelines = ["rag", "chain"] if args.pipeline == "all" else [args.pipeline]
+
+    results = []
+    for name in pipelines:
+        recorder = StageRecorder()
+        vector_store, llm, s3_client, queries = build_stack(args, recorder)
+        request_pool = None
+        if name == "rag":
+            pipeline = make_rag_pipeline(vector_store, llm, s3_client, args.k)
+            if args.pool_workers:
+                request_pool = RequestPool(max_workers=args.pool_workers, max_queue=args.pool_queue)
+                pipeline = make_pooled_pipeline(pipeline, request_pool)
+        else:
+            pipeline = make_chain_pipeline(vector_store, llm, args.k)
+        wall_time, errors = run_load(pipeline, queries, recorder, args.users, args.requests)
+        if errors:
+            print(f"{len(errors)} requests failed in {name}, first error: {errors[0]!r}")
+        summary = summarize(name, recorder, wall_time, errors, args.users)
+        if request_pool is not None:
+            summary["pool"] = dict(request_pool.stats)
+            request_pool.shutdown()
+        print_summary(summary)
+        results.append(summary)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.max_p95_ms is not None:
+        slow = [r["pipeline"] for r in results if r["stages"]["total"]["p95_ms"] > args.max_p95_ms]
+        if slow:
+            print(f"p95 latency above {args.max_p95_ms} ms for: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Build or refresh the pre-computed FAQ answer index (faq_index.py).
+
+Run it after each ingestion batch. For every drug and every question template
+it re-runs retrieval for the canonical question and compares the retrieved
+chunk hashes with the ones stored for the entry:
+  - unchanged: the stored answer is kept, no LLM call
+  - changed or new: the answer is regenerated through
+    `utils.retrieve_and_format_response` with the app's patient education
+    prompt, over the same retriever setup as the app (pass the app's
+    `vo_index_name` as --index-name)
+With --staging-dir, entries built from chunks that are no longer staged are
+invalidated up front (`FaqIndex.invalidate`) and regenerated directly.
+Entries for drugs or templates no longer listed are removed, and answers that
+found nothing ("I don't know...") are not stored, so those questions keep
+going through the live path.
+
+Drugs come from a text file (one name per line) and/or from a directory of
+staging chunks (e.g. `aws s3 sync s3://<bucket>/staging ./staging`): the
+`Name` column of CSV rows and the `Name:` lines of text chunks in the DrugBank
+collection. MedlinePlus pages have `Name:` lines too, but they name diseases.
+
+Example:
+    python build-faq-index.py faq_index.json --staging-dir ./staging --workers 8
+    python build-faq-index.py faq_index.json --dry-run   # local stand-ins, no API keys
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from faq_index import FaqIndex, RawS3Links, load_templates, source_hash, source_hashes
+from metadata_filters import retrieve_documents
+from prompts import PATIENT_EDUCATION_PROMPT
+from ratelimit import RateLimiter, retry_with_backoff
+from utils import NOT_FOUND_ANSWER, retrieve_and_format_response
+
+# Ignore all warnings
+warnings.filterwarnings("ignore")
+
+# Collections whose text chunks start with a drug's `Name:` line
+DRUG_COLLECTIONS = {"drugbank"}
+
+# Rewrite the index file after this many regenerated answers, so an interrupted build keeps its work
+SAVE_EVERY = 50
+
+
+def load_batch_qa():
+    # The script name has a dash in it, so load it from its path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch-qa.py")
+    spec = importlib.util.spec_from_file_location("batch_qa", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def staging_chunks(staging_dir):
+    for path in glob.glob(os.path.join(staging_dir, "**", "*.json"), recursive=True):
+        with open(path, encoding="utf-8") as file:
+            yield path, json.load(file)
+
+
+def staged_hashes(staging_dir):
+    """Content hashes of every staged chunk, read the same way as from the retrieved metadata."""
+    return {source_hash({"content_hash": chunk.get("content_hash"), "id": path}) for path, chunk in staging_chunks(staging_dir)}
+
+
+def drugs_from_staging(staging_dir):
+    drugs = set()
+    for path, chunk in staging_chunks(staging_dir):
+        content = chunk["content"]
+        # Chunks staged before ingestion tagged collections still sit under their collection's folder
+        collection = chunk.get("collection") or os.path.relpath(path, staging_dir).split(os.sep)[0]
+        if isinstance(content, dict):
+            # DrugBank CSV rows
+            name = content.get("Name")
+        elif collection in DRUG_COLLECTIONS:
+            first_line = content.split("\n", 1)[0]
+            name = first_line[len("Name:"):] if first_line.startswith("Name:") else None
+        else:
+            continue
+        if name and name.strip() and name.strip() != "N/A":
+            drugs.add(name.strip())
+    return drugs
+
+
+def load_drugs(args):
+    drugs = set()
+    if args.drugs:
+        with open(args.drugs, encoding="utf-8") as file:
+            drugs.update(line.strip() for line in file if line.strip())
+    if args.staging_dir:
+        drugs.update(drugs_from_staging(args.staging_dir))
+    if not drugs and args.dry_run:
+        from benchmark import build_corpus
+        drugs.update(name for name, _ in build_corpus(200)[2][:args.dry_run_drugs])
+    return sorted(drugs)
+
+
+def refresh_entry(entry, question, retriever, llm, force=False, retries=5):
+    """Returns (outcome, result): outcome is "kept", "generated", "not_found" or "failed"."""
+    try:
+        if entry is not None and not force:
+            # Retrieval alone (one embedding and one search) tells us whether the sources changed
+            docs, _ = retry_with_backoff(lambda: retrieve_documents(retriever, question), retries=retries)
+            if source_hashes([doc.metadata for doc in docs]) == entry["source_hashes"]:
+                return "kept", None
+        # Links are stored as s3:// URIs and signed when the answer is served
+        result = retry_with_backoff(
+            lambda: retrieve_and_format_response(
+                question, retriever, llm, s3_client=RawS3Links(), prompt_template=PATIENT_EDUCATION_PROMPT
+            ),
+            retries=retries,
+        )
+    except Exception as e:
+        print(f"Failed to answer {question!r}: {e!r}")
+        return "failed", None
+    # The prompt asks for exactly these words when nothing relevant was found;
+    # a substring check would also drop real answers that happen to contain "I don't know"
+    if result["answer"].strip() == NOT_FOUND_ANSWER or not result["sources"]:
+        return "not_found", None
+    return "generated", result
+
+
+def build(faq_index, drugs, templates, retriever, llm, workers=8, force=False, retries=5, changed_hashes=None):
+    counts = {"kept": 0, "generated": 0, "not_found": 0, "failed": 0, "removed": 0, "invalidated": 0}
+
+    # Entries built from chunks known to have changed are regenerated without the retrieval check
+    if changed_hashes:
+        counts["invalidated"] = faq_index.invalidate(changed_hashes)
+
+    # Entries for drugs or templates that are no longer listed
+    wanted = {FaqIndex.entry_id(template_id, drug) for template_id in templates for drug in drugs}
+    for entry_id in [entry_id for entry_id in faq_index.entries if entry_id not in wanted]:
+        faq_index.remove(entry_id)
+        counts["removed"] += 1
+
+    # Workers only retrieve and answer; the index itself is only touched from this thread
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for template_id, phrasings in templates.items():
+            for drug in drugs:
+                entry = faq_index.get(FaqIndex.entry_id(template_id, drug))
+                question = phrasings[0].format(drug=drug)
+                future = executor.submit(refresh_entry, entry, question, retriever, llm, force=force, retries=retries)
+                futures[future] = (template_id, phrasings, drug)
+        for done, future in enumerate(as_completed(futures), start=1):
+            template_id, phrasings, drug = futures[future]
+            outcome, result = future.result()
+            counts[outcome] += 1
+            if outcome == "generated":
+                faq_index.add(template_id, drug, phrasings, result["answer"], result["sources"])
+                if counts["generated"] % SAVE_EVERY == 0:
+                    faq_index.save()
+            elif outcome == "not_found":
+                faq_index.remove(FaqIndex.entry_id(template_id, drug))
+            print(f"{done}/{len(futures)} checked ({counts['generated']} generated, {counts['kept']} kept)", end="\r")
+    print()
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the pre-computed FAQ answer index.")
+    parser.add_argument("output", help="Index file, refreshed in place if it exists")
+    parser.add_argument("--drugs", help="Text file with one drug name per line")
+    parser.add_argument("--staging-dir", help="Directory of staging chunks to collect drug names from")
+    parser.add_argument("--templates", help="JSON file mapping template ids to phrasings ({drug} placeholder)")
+    parser.add_argument("--force", action="store_true", help="Regenerate every answer, even if its sources are unchanged")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--index-name", default="drugbank",
+                        help="Pinecone index, or a comma-separated list of index[:namespace] like vo_index_name")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--openai-rpm", type=int, default=500, help="OpenAI requests per minute")
+    parser.add_argument("--openai-tpm", type=int, default=30000, help="OpenAI tokens per minute")
+    parser.add_argument("--voyage-rpm", type=int, default=300, help="Voyage AI requests per minute")
+    parser.add_argument("--voyage-tpm", type=int, default=1000000, help="Voyage AI tokens per minute")
+    parser.add_argument("--dry-run", action="store_true", help="Use the local stand-ins from fakes.py")
+    parser.add_argument("--dry-run-drugs", type=int, default=20, help="Drugs from the fake corpus to use with --dry-run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    drugs = load_drugs(args)
+    templates = load_templates(args.templates)
+    if not drugs:
+        print("No drugs found, pass --drugs and/or --staging-dir")
+        return 1
+
+    faq_index = FaqIndex(args.output)
+    print(f"{len(drugs)} drugs x {len(templates)} templates, {len(faq_index)} answers already in {args.output}")
+
+    batch_qa = load_batch_qa()
+    llm_limiter = RateLimiter("openai", requests_per_minute=args.openai_rpm, tokens_per_minute=args.openai_tpm)
+    embed_limiter = RateLimiter("voyage", requests_per_minute=args.voyage_rpm, tokens_per_minute=args.voyage_tpm)
+    build_stack = batch_qa.build_dry_run_stack if args.dry_run else batch_qa.build_live_stack
+    retriever, llm, _ = build_stack(args, llm_limiter, embed_limiter)
+
+    changed_hashes = None
+    if args.staging_dir:
+        # Chunks the stored answers were built from that are no longer staged were replaced or deleted
+        stored_hashes = {h for entry in faq_index.entries.values() for h in entry["source_hashes"]}
+        changed_hashes = stored_hashes - staged_hashes(args.staging_dir)
+
+    start = time.perf_counter()
+    counts = build(faq_index, drugs, templates, retriever, llm, workers=args.workers, force=args.force,
+                   retries=args.retries, changed_hashes=changed_hashes)
+    faq_index.save()
+    elapsed = time.perf_counter() - start
+    print(f"{len(faq_index)} answers in {args.output} after {elapsed:.1f}s: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
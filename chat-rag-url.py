@@ -17,10 +17,17 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 import uuid
 import warnings
+from tracing import tracer, TracedEmbeddings
+from metadata_filters import retrieve_documents
+from prompts import PATIENT_EDUCATION_PROMPT
+from federated_retriever import build_retriever
 
 # Ignore all warnings
 warnings.filterwarnings("ignore")
 
+# The `magic words` the prompt asks for when the knowledge base has nothing relevant
+NOT_FOUND_ANSWER = "I don't know, I did not find the relevant data in the knowledge base."
+
 # Function to generate pre-signed URL
 def generate_presigned_url(s3_uri):
     parsed_url = urlparse(s3_uri)
@@ -34,35 +41,43 @@ def generate_presigned_url(s3_uri):
     return presigned_url
 
 # Function to retrieve documents, generate URLs, and format the response
-def retrieve_and_format_response(query, retriever, llm):
-    docs = retriever.get_relevant_documents(query)
-    
-    formatted_docs = []
-    for doc in docs:
-        content_data = doc.page_content
-        s3_uri = doc.metadata['id']
-        s3_gen_url = generate_presigned_url(s3_uri)
-        formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
-        formatted_docs.append(formatted_doc)
-    
-    combined_content = "\n\n".join(formatted_docs)
-    # print(combined_content)
-    
-    # Create a prompt for the LLM to generate an explanation based on the retrieved content
-    prompt = f"Instruction: You are a helpful assistant to help users with their patient education queries. \
-               Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
-               Only respond with the information relevant to the user query {query}, \
-               if there are none, make sure you say the `magic words`: 'I don't know, I did not find the relevant data in the knowledge base.' \
-               But you could carry out some conversations with the user to make them feel welcomed and comfortable, in that case you don't have to say the `magic words`. \
-               In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
-               Context: {combined_content}"
-    
-    # Create the messages for the LLM input
-    messages = [HumanMessage(content=prompt)]
-    
-    # Generate the response using the LLM
-    response = llm(messages=messages)
-    return {"answer": response.content}
+def retrieve_and_format_response(query, retriever, llm, use_filters=True):
+    with tracer.trace("retrieve_and_format_response"):
+        with tracer.span("retrieve") as span:
+            # Narrow the search with metadata inferred from the question
+            docs, metadata_filter = retrieve_documents(retriever, query, use_filters=use_filters)
+            span.set_attribute("documents", len(docs))
+            span.set_attribute("filtered", metadata_filter is not None)
+        
+        # Nothing to build an answer from (e.g. every index timed out), so don't ask the LLM
+        if not docs:
+            return {"answer": NOT_FOUND_ANSWER}
+        
+        formatted_docs = []
+        with tracer.span("sign", urls=len(docs)):
+            for doc in docs:
+                content_data = doc.page_content
+                s3_uri = doc.metadata['id']
+                s3_gen_url = generate_presigned_url(s3_uri)
+                formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
+                formatted_docs.append(formatted_doc)
+        
+        with tracer.span("prompt") as span:
+            combined_content = "\n\n".join(formatted_docs)
+            # print(combined_content)
+            
+            # Create a prompt for the LLM to generate an explanation based on the retrieved content
+            prompt = PATIENT_EDUCATION_PROMPT.format(query=query, s3_gen_url=s3_gen_url, combined_content=combined_content)
+            
+            # Create the messages for the LLM input
+            messages = [HumanMessage(content=prompt)]
+            span.count_tokens("prompt_tokens", prompt)
+        
+        # Generate the response using the LLM
+        with tracer.span("llm") as span:
+            response = llm(messages=messages)
+            span.count_tokens("completion_tokens", response.content)
+        return {"answer": response.content}
 
 
 # Function to save chat history to a file
@@ -90,33 +105,24 @@ if __name__ == "__main__":
 
     # VOYAGE AI
     model_name = "voyage-large-2"  
-    embeddings = VoyageAIEmbeddings(
+    # Wrapped so query embedding time shows up in the request traces
+    embeddings = TracedEmbeddings(VoyageAIEmbeddings(
         model=model_name,  
         voyage_api_key=os.environ["VOYAGE_AI_API_KEY"]
-    )
+    ))
     # PINECONE
     pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
-    index_name = "drugbank"
+    # Add more indexes, or "index:namespace" entries, to search them all in parallel
+    index_names = ["drugbank"]
 
     # Retriever
-    docsearch = PineconeVectorStore.from_existing_index(
-        index_name=index_name,
-        embedding=embeddings
-    )
+    retriever = build_retriever(index_names, embeddings)
     
     # Initialize the OpenAI model
     llm = ChatOpenAI(model="gpt-4o", openai_api_key=openai.api_key)
 
     # Create a simple chat prompt template
-    prompt_template = ChatPromptTemplate.from_template(
-        "Instruction: You are a helpful assistant to help users with their patient education queries. \
-        Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
-        Only respond with the information relevant to the user query {query}, \
-        if there are none, make sure you say the `magic words`: 'I don't know, I did not find the relevant data in the knowledge base.' \
-        But you could carry out some conversations with the user to make them feel welcomed and comfortable, in that case you don't have to say the `magic words`. \
-        In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
-        Context: {combined_content}"
-    )
+    prompt_template = ChatPromptTemplate.from_template(PATIENT_EDUCATION_PROMPT)
 
     print("Simple Chatbot with Memory (Type 'exit' to quit)")
     chat_history = f"\nSession ID: {session_id}\n"
@@ -126,7 +132,7 @@ if __name__ == "__main__":
         # INPUT #
         if user_input.lower() == "exit":
             break
-        response = retrieve_and_format_response(user_input, docsearch.as_retriever(), llm)
+        response = retrieve_and_format_response(user_input, retriever, llm)
         # OUTPUT #
         print(f"Bot: {response['answer']}")
         # OUTPUT #
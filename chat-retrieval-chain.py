@@ -9,32 +9,6 @@ from langchain_voyageai import VoyageAIEmbeddings
 from langchain.chains import create_history_aware_retriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-# Setup
-os.environ["OPENAI_API_KEY"] = ""
-os.environ["VOYAGE_AI_API_KEY"] = ""
-os.environ["PINECONE_API_KEY"] = ""
-
-# Pull the retrieval QA chat prompt
-retrieval_qa_chat_prompt = hub.pull("langchain-ai/retrieval-qa-chat")
-llm = ChatOpenAI()
-
-# Initialize the retriever using PineconeVectorStore
-model_name = "voyage-large-2"
-embedding_function = VoyageAIEmbeddings(
-    model=model_name,
-    voyage_api_key=os.environ["VOYAGE_AI_API_KEY"]
-)
-vector_store = PineconeVectorStore.from_existing_index(
-    embedding=embedding_function,
-    index_name="drugbank"
-)
-retriever = vector_store.as_retriever()
-
-# Create the combined documents chain
-# combine_docs_chain = create_stuff_documents_chain(
-#     llm, retrieval_qa_chat_prompt
-# )
-
 # CODE DIRECTLY FROM LANGCHAIN DOCUMENTATION
 contextualize_q_system_prompt = (
     "Given a chat history and the latest user question "
@@ -52,10 +26,6 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-history_aware_retriever = create_history_aware_retriever(
-    llm, retriever, contextualize_q_prompt
-)
-
 # ADDED
 system_prompt = (
     "You are an assistant for question-answering tasks. "
@@ -75,16 +45,6 @@ qa_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-question_answer_chain = create_stuff_documents_chain(llm, retrieval_qa_chat_prompt)
-
-rag_retreival_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-# Initialize memory
-memory = ConversationBufferMemory()
-
-# Create the retrieval chain
-# retrieval_chain = create_retrieval_chain(retriever, combine_docs_chain)
-
 # CODE DIRECTLY FROM LANGCHAIN DOCUMENTATION
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
@@ -97,15 +57,24 @@ def get_session_history(session_id: str) -> BaseChatMessageHistory:
         store[session_id] = ChatMessageHistory()
     return store[session_id]
 
-conversational_rag_chain = RunnableWithMessageHistory(
-    rag_retreival_chain,
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-    output_messages_key="answer",
-)
-
-def chat():
+# Build the conversational chain from any chat model and retriever
+# (also used by benchmark.py with local stand-ins)
+def build_conversational_rag_chain(llm, retriever, chat_prompt=qa_prompt):
+    history_aware_retriever = create_history_aware_retriever(
+        llm, retriever, contextualize_q_prompt
+    )
+    question_answer_chain = create_stuff_documents_chain(llm, chat_prompt)
+    rag_retreival_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+    return RunnableWithMessageHistory(
+        rag_retreival_chain,
+        get_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
+
+def chat(conversational_rag_chain):
     print("Start chatting with the bot (type 'exit' to stop):")
     while True:
         user_input = input("You: ")
@@ -116,5 +85,32 @@ def chat():
         response = conversational_rag_chain.invoke({"input": user_input}, config={"configurable": {"session_id": "test"}})["answer"]
         print("Bot:", response)
 
-# Start the chat
-chat()
+if __name__ == "__main__":
+    # Setup
+    os.environ["OPENAI_API_KEY"] = ""
+    os.environ["VOYAGE_AI_API_KEY"] = ""
+    os.environ["PINECONE_API_KEY"] = ""
+
+    # Pull the retrieval QA chat prompt
+    retrieval_qa_chat_prompt = hub.pull("langchain-ai/retrieval-qa-chat")
+    llm = ChatOpenAI()
+
+    # Initialize the retriever using PineconeVectorStore
+    model_name = "voyage-large-2"
+    embedding_function = VoyageAIEmbeddings(
+        model=model_name,
+        voyage_api_key=os.environ["VOYAGE_AI_API_KEY"]
+    )
+    vector_store = PineconeVectorStore.from_existing_index(
+        embedding=embedding_function,
+        index_name="drugbank"
+    )
+    retriever = vector_store.as_retriever()
+
+    # Initialize memory
+    memory = ConversationBufferMemory()
+
+    conversational_rag_chain = build_conversational_rag_chain(llm, retriever, retrieval_qa_chat_prompt)
+
+    # Start the chat
+    chat(conversational_rag_chain)
@@ -0,0 +1,102 @@
+"""
+Bulk drug-category classifier.
+
+`best_drug_category` in data-gathering.ipynb re-embedded all of
+`distinct_drug_categories` together with one drug on every call and then built
+a full pairwise cosine similarity matrix to read a single row. Here the
+category embeddings are computed once (and cached on disk), drug descriptions
+are embedded in large batches with duplicates removed, and every drug is
+classified with one normalized matrix multiply and an argmax.
+
+Usage from the notebook:
+    classifier = DrugCategoryClassifier(voyage_embed_fn(vo), distinct_drug_categories,
+                                        cache_path="./category_embeddings.json")
+    df["one_category"] = classifier.classify(df["Drug Categories"].tolist())
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def voyage_embed_fn(client, model="voyage-large-2"):
+    """Adapts a `voyageai.Client` to the list-of-texts -> list-of-vectors function used here."""
+    def embed(texts):
+        return client.embed(texts, model=model).embeddings
+    return embed
+
+
+def chunk_list(lst, chunk_size, token_limit):
+    """Yield successive chunks from lst with a limit on chunk size and token count."""
+    chunk = []
+    total_tokens = 0
+    for text in lst:
+        token_count = len(text.split())
+        if chunk and (len(chunk) >= chunk_size or (total_tokens + token_count) > token_limit):
+            yield chunk
+            chunk = []
+            total_tokens = 0
+        chunk.append(text)
+        total_tokens += token_count
+    if chunk:
+        yield chunk
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class DrugCategoryClassifier:
+    def __init__(self, embed_fn, categories, cache_path=None, model="voyage-large-2",
+                 batch_size=128, token_limit=6000):
+        self.embed_fn = embed_fn
+        self.categories = list(categories)
+        self.batch_size = batch_size
+        self.token_limit = token_limit
+        self.api_calls = 0
+        self.category_matrix = self._load_category_matrix(cache_path, model)
+
+    def _embed(self, texts):
+        vectors = []
+        # Same batching limits as transform_text_columns_to_embeddings in the notebook
+        for batch in chunk_list(texts, self.batch_size, self.token_limit):
+            vectors.extend(self.embed_fn(batch))
+            self.api_calls += 1
+        return vectors
+
+    def _load_category_matrix(self, cache_path, model):
+        # The cache is only valid for the same model and the same category list
+        key = hashlib.sha256(json.dumps([model, self.categories]).encode("utf-8")).hexdigest()
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as file:
+                cached = json.load(file)
+            if cached.get("key") == key:
+                return _normalize(cached["embeddings"])
+        embeddings = self._embed(self.categories)
+        if cache_path:
+            with open(cache_path, "w", encoding="utf-8") as file:
+                json.dump({"key": key, "model": model, "categories": self.categories,
+                           "embeddings": [list(map(float, v)) for v in embeddings]}, file)
+        return _normalize(embeddings)
+
+    def scores(self, descriptions):
+        """Cosine similarity of every description (rows) to every category (columns)."""
+        descriptions = [str(d) for d in descriptions]
+        # DrugBank category strings repeat a lot, so only embed each distinct one once
+        unique = list(dict.fromkeys(descriptions))
+        if not unique:
+            return np.zeros((0, len(self.categories)), dtype=np.float32)
+        unique_scores = _normalize(self._embed(unique)) @ self.category_matrix.T
+        row_of = {text: row for row, text in enumerate(unique)}
+        return unique_scores[[row_of[d] for d in descriptions]]
+
+    def classify(self, descriptions):
+        """Best-fitting category for each description, in input order."""
+        best = self.scores(descriptions).argmax(axis=1)
+        return [self.categories[i] for i in best]
+
+    def classify_one(self, description):
+        return self.classify([description])[0]
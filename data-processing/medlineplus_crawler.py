@@ -0,0 +1,267 @@
+"""
+Incremental MedlinePlus crawler.
+
+Replaces the one-request-at-a-time `get_disease_info` loop in
+data-gathering.ipynb. Articles are fetched with asyncio over one pooled HTTP
+session, with bounded per-host concurrency and a politeness delay between
+requests to the same host. ETag/Last-Modified values are kept in a local crawl
+state file and sent back as conditional requests, so unchanged articles come
+back as `304 Not Modified` and are skipped, as are known-missing article IDs.
+An article's new state is only recorded once the caller has handled it (e.g.
+written its file), so an article whose write failed is fetched again next run.
+
+New or changed articles are written as the same `Name:`/`Definition:` text
+files the notebook produced, which is what the ingestion Lambda expects under
+`raw/` (push them with s3_bulk_upload.py).
+
+Example:
+    python data-processing/medlineplus_crawler.py --start 0 --end 1000 --out ./data/medlineplus/
+    python data-processing/medlineplus_crawler.py --base-url http://localhost:8000/ency/article/   # local stand-in
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+# Define the base URL of the MedlinePlus articles
+BASE_URL = 'https://medlineplus.gov/ency/article/'
+
+USER_AGENT = "pec-med-chatbot-crawler/1.0"
+
+
+class RetryableStatus(Exception):
+    """Raised for 429 and 5xx responses, carrying the server's Retry-After if any."""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CrawlState:
+    """Per-URL validators and content hashes, persisted as JSON between runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def get(self, url):
+        return self.entries.get(url, {})
+
+    def update(self, url, **fields):
+        entry = self.entries.setdefault(url, {})
+        entry.update(fields)
+        entry["checked_at"] = time.time()
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so an interrupted run never corrupts the state
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.path)
+
+
+class HostThrottle:
+    """Bounds concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        self._semaphores = {}
+        self._locks = {}
+        self._last_start = {}
+
+    def _for_host(self, host):
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+            self._locks[host] = asyncio.Lock()
+            self._last_start[host] = 0.0
+        return self._semaphores[host], self._locks[host]
+
+    @asynccontextmanager
+    async def host(self, host):
+        semaphore, lock = self._for_host(host)
+        async with semaphore:
+            async with lock:
+                wait = self._last_start[host] + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._last_start[host] = time.monotonic()
+            yield
+
+
+def parse_article(html):
+    """Extract the disease name and definition, as get_disease_info did."""
+    soup = BeautifulSoup(html, 'html.parser')
+    heading = soup.find('h1')
+    if heading is None:
+        return None
+    definition_section = soup.find('div', class_='section')
+    definition = definition_section.text.strip() if definition_section else "No definition found."
+    return {'name': heading.text.strip(), 'definition': definition}
+
+
+def article_text(disease_info):
+    return f"Name: {disease_info['name']}\nDefinition: {disease_info['definition']}\n"
+
+
+def article_filename(disease_info):
+    # Same filtering as save_disease_info, with spaces replaced because raw file names cannot contain them
+    filename = "".join(c for c in disease_info['name'] if c.isalnum() or c in (' ', '_')).strip()
+    return filename.replace(' ', '_') + ".txt"
+
+
+async def fetch_article(session, throttle, state, url, retries=3, recheck_missing=False):
+    """
+    Returns (status, disease_info, state_fields). status is one of new, changed, unchanged,
+    missing, error; state_fields is what to record for the URL once the article is handled.
+    """
+    entry = state.get(url)
+    if entry.get("status") == 404 and not recheck_missing:
+        return "missing", None, None
+
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    host = urlparse(url).netloc
+    for attempt in range(retries + 1):
+        try:
+            async with throttle.host(host):
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        return "unchanged", None, {"status": 304}
+                    if response.status == 404:
+                        return "missing", None, {"status": 404}
+                    if response.status == 429 or response.status >= 500:
+                        retry_after = response.headers.get("Retry-After", "")
+                        raise RetryableStatus(response.status, int(retry_after) if retry_after.isdigit() else None)
+                    response.raise_for_status()
+                    html = await response.text()
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus) as e:
+            if attempt == retries:
+                print(f"Error fetching disease info from {url}: {e!r}")
+                return "error", None, None
+            retry_after = getattr(e, "retry_after", None)
+            await asyncio.sleep(retry_after if retry_after is not None else random.uniform(0, 2 ** attempt))
+
+    state_fields = {"status": 200, "etag": etag, "last_modified": last_modified}
+    disease_info = parse_article(html)
+    if disease_info is None:
+        return "missing", None, state_fields
+
+    # Servers without validators still get deduplicated on content
+    content_hash = hashlib.sha256(article_text(disease_info).encode("utf-8")).hexdigest()[:16]
+    previous_hash = entry.get("content_hash")
+    state_fields["content_hash"] = content_hash
+    if previous_hash == content_hash:
+        return "unchanged", None, state_fields
+    return ("changed" if previous_hash else "new"), disease_info, state_fields
+
+
+async def crawl(article_ids, state, base_url=BASE_URL, concurrency=2, delay=0.5, timeout=30,
+                recheck_missing=False, save_every=100):
+    """
+    Async generator yielding (article_id, status, disease_info) as articles complete.
+
+    The state for an article is updated when the caller asks for the next one, so
+    whatever the caller does with it (writing the file) has succeeded by then.
+    """
+    throttle = HostThrottle(concurrency, delay)
+    connector = aiohttp.TCPConnector(limit=concurrency * 4, limit_per_host=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers={"User-Agent": USER_AGENT}) as session:
+        async def fetch(article_id):
+            url = f'{base_url}{article_id}.htm'
+            result = await fetch_article(session, throttle, state, url, recheck_missing=recheck_missing)
+            return (article_id, url) + result
+
+        # Schedule in windows so a large ID range does not create every task up front
+        window = max(concurrency * 8, 16)
+        article_ids = iter(article_ids)
+        pending = set()
+        done_count = 0
+        try:
+            while True:
+                for article_id in article_ids:
+                    pending.add(asyncio.ensure_future(fetch(article_id)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    article_id, url, status, disease_info, state_fields = task.result()
+                    yield article_id, status, disease_info
+                    # Back here only if the caller handled the article without raising
+                    if state_fields:
+                        state.update(url, **state_fields)
+                    done_count += 1
+                    if done_count % save_every == 0:
+                        state.save()
+        finally:
+            # Articles already handled keep their state even if the caller stopped with an error
+            for task in pending:
+                task.cancel()
+            state.save()
+
+
+async def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    state = CrawlState(args.state or os.path.join(args.out, ".crawl_state.json"))
+    article_ids = [f'{article_id:06}' for article_id in range(args.start, args.end)]  # Zero-pad to match the article ID format
+
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "missing": 0, "error": 0}
+    start = time.perf_counter()
+    async for article_id, status, disease_info in crawl(
+        article_ids, state, base_url=args.base_url, concurrency=args.concurrency,
+        delay=args.delay, recheck_missing=args.recheck_missing,
+    ):
+        counts[status] += 1
+        if disease_info:
+            filepath = os.path.join(args.out, article_filename(disease_info))
+            with open(filepath, 'w', encoding='utf-8') as file:
+                file.write(article_text(disease_info))
+            print(f"Saved ({status}): {filepath}")
+    elapsed = time.perf_counter() - start
+    print(f"Crawled {len(article_ids)} articles in {elapsed:.1f}s: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally crawl MedlinePlus encyclopedia articles.")
+    parser.add_argument("--start", type=int, default=0, help="First article ID")
+    parser.add_argument("--end", type=int, default=1000, help="Last article ID (exclusive)")
+    parser.add_argument("--out", default="./data/medlineplus/", help="Directory for the article text files")
+    parser.add_argument("--state", help="Crawl state file (default: <out>/.crawl_state.json)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=2, help="Concurrent requests per host")
+    parser.add_argument("--delay", type=float, default=0.5, help="Minimum seconds between requests to one host")
+    parser.add_argument("--recheck-missing", action="store_true", help="Retry article IDs that returned 404 before")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
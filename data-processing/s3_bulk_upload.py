@@ -0,0 +1,213 @@
+"""
+Bulk uploader for the `raw/` prefix that triggers the ingestion Lambda.
+
+Replaces `upload_files_concurrently` from upload-to-s3.ipynb, which built a new
+boto3 client per file, only looked at the top level of a directory and
+re-uploaded everything. Here:
+  - one S3 client, with a connection pool sized to the worker count, is
+    shared by every upload thread
+  - large files go through multipart transfers (TransferConfig below)
+  - the directory is walked recursively and each file's S3-style ETag is
+    compared with the ETags already under the prefix (one paginated listing),
+    so only new or changed files are uploaded. Every upload re-triggers the
+    ingestion Lambda, so skipping unchanged files saves compute downstream too.
+  - local ETags are cached by (size, mtime) so unchanged files are not re-hashed
+
+ETags only match MD5s for SSE-S3 or unencrypted objects; with SSE-KMS every
+file looks changed, so use --force knowingly there.
+
+Example:
+    python data-processing/s3_bulk_upload.py ./data/drugbank/ <BUCKET_NAME> --prefix raw/ --workers 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MB = 1024 * 1024
+
+# Files above the threshold are sent as parallel multipart uploads
+MULTIPART_THRESHOLD = 16 * MB
+MULTIPART_CHUNKSIZE = 16 * MB
+MULTIPART_CONCURRENCY = 4
+
+CACHE_FILE = ".upload-etags.json"
+
+
+def create_s3_client(workers, aws_access_key_id=None, aws_secret_access_key=None, region_name=None):
+    import boto3
+    from botocore.config import Config
+
+    # boto3 clients are thread-safe; size the pool so threads never wait for a connection
+    config = Config(max_pool_connections=workers * MULTIPART_CONCURRENCY, retries={"max_attempts": 5, "mode": "adaptive"})
+    return boto3.client(
+        's3',
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region_name,
+        config=config,
+    )
+
+
+def transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=MULTIPART_CHUNKSIZE,
+        max_concurrency=MULTIPART_CONCURRENCY,
+        use_threads=True,
+    )
+
+
+def local_etag(path, chunksize=MULTIPART_CHUNKSIZE, threshold=MULTIPART_THRESHOLD):
+    """The ETag S3 will report for this file when uploaded with our transfer settings."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        if size < threshold:
+            digest = hashlib.md5()
+            for block in iter(lambda: file.read(MB), b""):
+                digest.update(block)
+            return f'"{digest.hexdigest()}"'
+        # Multipart ETag: md5 of the concatenated part digests, plus the part count
+        part_digests = []
+        for part in iter(lambda: file.read(chunksize), b""):
+            part_digests.append(hashlib.md5(part).digest())
+    return f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}"'
+
+
+class EtagCache:
+    """Local ETags keyed by path, reused while a file's size and mtime are unchanged."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def etag(self, file_path):
+        stat = os.stat(file_path)
+        entry = self.entries.get(file_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["etag"]
+        etag = local_etag(file_path)
+        with self._lock:
+            self.entries[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "etag": etag}
+        return etag
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.path)
+
+
+def list_files(directory):
+    """Every file under `directory` as (path, S3-style relative key)."""
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            files.append((path, os.path.relpath(path, directory).replace(os.sep, "/")))
+    return sorted(files)
+
+
+def list_remote_etags(s3_client, bucket, prefix):
+    """ETags of every object under `prefix`, from a paginated listing."""
+    etags = {}
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        for obj in response.get("Contents", []):
+            etags[obj["Key"]] = obj["ETag"]
+        if not response.get("IsTruncated"):
+            return etags
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def upload_directory(directory, bucket, s3_client, prefix="raw/", workers=8, config=None, force=False, dry_run=False):
+    """Upload new or changed files under `directory` to `s3://bucket/prefix`. Returns a summary dict."""
+    start = time.perf_counter()
+    cache = EtagCache(os.path.join(directory, CACHE_FILE))
+    remote_etags = {} if force else list_remote_etags(s3_client, bucket, prefix)
+
+    def needs_upload(path, key):
+        return force or remote_etags.get(key) != cache.etag(path)
+
+    files = [(path, prefix + relative_key) for path, relative_key in list_files(directory)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Hashing is I/O bound too, so run it on the pool as well
+        checks = list(executor.map(lambda item: needs_upload(*item), files))
+    pending = [item for item, changed in zip(files, checks) if changed]
+
+    summary = {"uploaded": 0, "skipped": len(files) - len(pending), "failed": 0, "bytes": 0}
+    lock = threading.Lock()
+
+    def upload(path, key):
+        size = os.path.getsize(path)
+        if dry_run:
+            print(f"Would upload {path} to {bucket}/{key}")
+            return size
+        s3_client.upload_file(path, bucket, key, Config=config)
+        print(f"File {path} uploaded to {bucket}/{key}")
+        return size
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload, path, key): (path, key) for path, key in pending}
+        for future in as_completed(futures):
+            path, key = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                print(f"Failed to upload {path} to {bucket}/{key}: {e}")
+                with lock:
+                    summary["failed"] += 1
+                continue
+            with lock:
+                summary["uploaded"] += 1
+                summary["bytes"] += size
+
+    if not dry_run:
+        cache.save()
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = elapsed
+    summary["mb_per_second"] = summary["bytes"] / MB / elapsed if elapsed else 0.0
+    summary["files_per_second"] = summary["uploaded"] / elapsed if elapsed else 0.0
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload new or changed files to S3 for ingestion.")
+    parser.add_argument("directory", help="Local directory, walked recursively")
+    parser.add_argument("bucket")
+    parser.add_argument("--prefix", default="raw/", help="Key prefix; raw/ triggers the ingestion Lambda")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--region")
+    parser.add_argument("--force", action="store_true", help="Upload every file, even if unchanged")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be uploaded")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    s3_client = create_s3_client(args.workers, region_name=args.region)
+    summary = upload_directory(
+        args.directory, args.bucket, s3_client, prefix=args.prefix, workers=args.workers,
+        config=transfer_config(), force=args.force, dry_run=args.dry_run,
+    )
+    print(f"Uploaded {summary['uploaded']} files ({summary['bytes'] / MB:.1f} MB), skipped {summary['skipped']} unchanged, "
+          f"{summary['failed']} failed in {summary['seconds']:.1f}s "
+          f"({summary['mb_per_second']:.1f} MB/s, {summary['files_per_second']:.1f} files/s)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
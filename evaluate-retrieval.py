@@ -0,0 +1,235 @@
+"""
+Retrieval evaluation: recall@k and MRR against prompt size and latency.
+
+Takes a labeled set of questions (JSONL: {"question": ..., "relevant": [content_hash, ...]})
+and sweeps retriever configurations over:
+  - k, the number of documents retrieved
+  - the index: existing Pinecone indexes by name, and/or `local`, an in-memory
+    index built from a directory of staging chunks (as written by
+    lambda_functions/raw_data_processor.py, e.g. via `aws s3 sync s3://<bucket>/staging ./staging`)
+  - chunk size, for the local index only: staging chunks are re-split with the
+    same `split_into_chunks` the ingestion Lambda uses
+
+A retrieved chunk counts as relevant when its content hash, or the hash of the
+staging chunk it was re-split from, is in the question's labeled set.
+
+Example:
+    python evaluate-retrieval.py labeled.jsonl --indexes drugbank local --staging-dir ./staging \
+        --k 2 4 8 --chunk-tokens 8000 1000 250 --min-recall 0.9
+"""
+import argparse
+import functools
+import glob
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+import warnings
+
+from metadata_filters import FILTER_FIELDS, retrieve_documents
+from ratelimit import estimate_tokens
+
+# Ignore all warnings
+warnings.filterwarnings("ignore")
+
+# Staging keys end in _{content_hash}.json, see raw_data_processor.py
+CONTENT_HASH_PATTERN = re.compile(r"_([0-9a-f]{8})\.json$")
+
+
+def load_labeled_set(path):
+    labeled = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                labeled.append((record["question"], set(record["relevant"])))
+    return labeled
+
+
+@functools.lru_cache(maxsize=None)
+def load_ingestion_module():
+    # lambda_functions is not a package, so load the Lambda source from its path.
+    # Loading runs the Lambda's init (S3 client, tiktoken warm-up), so it is done once per process
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda_functions", "raw_data_processor.py")
+    spec = importlib.util.spec_from_file_location("raw_data_processor", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_staging_chunks(staging_dir):
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(staging_dir, "**", "*.json"), recursive=True)):
+        with open(path, encoding="utf-8") as file:
+            chunk = json.load(file)
+        chunk["key"] = os.path.relpath(path, staging_dir)
+        chunks.append(chunk)
+    return chunks
+
+
+def rechunk(chunks, max_tokens):
+    """Re-split staging chunks to `max_tokens`, keeping a link to the original chunk hash."""
+    ingestion = load_ingestion_module()
+    texts, metadatas = [], []
+    for chunk in chunks:
+        content = chunk["content"] if isinstance(chunk["content"], str) else json.dumps(chunk["content"])
+        if chunk.get("token_count", estimate_tokens(content)) <= max_tokens:
+            pieces = [content]
+        else:
+            pieces = ingestion.split_into_chunks(content, estimate_tokens, max_tokens=max_tokens)
+        for piece in pieces:
+            texts.append(piece)
+            metadatas.append({
+                # Filterable fields added at ingestion, so --filters can pre-filter the local index
+                **{field: chunk[field] for field in FILTER_FIELDS if field in chunk},
+                "id": chunk["source"],
+                "content_hash": ingestion.short_hash(piece),
+                "parent_hash": chunk["content_hash"],
+            })
+    return texts, metadatas
+
+
+def doc_hashes(doc):
+    """All hashes a retrieved document can be matched on."""
+    hashes = {doc.metadata.get("content_hash"), doc.metadata.get("parent_hash")}
+    match = CONTENT_HASH_PATTERN.search(str(doc.metadata.get("id", "")))
+    if match:
+        hashes.add(match.group(1))
+    hashes.discard(None)
+    return hashes
+
+
+def score_ranking(docs, relevant, k):
+    """Returns (recall@k, reciprocal rank) for one ranked list of documents."""
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(docs[:k], start=1):
+        matched = doc_hashes(doc) & relevant
+        if matched:
+            found |= matched
+            if not reciprocal_rank:
+                reciprocal_rank = 1.0 / rank
+    recall = len(found) / len(relevant) if relevant else 0.0
+    return recall, reciprocal_rank
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(pct / 100.0 * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+def evaluate(vector_store, labeled, k, use_filters=False):
+    recalls, reciprocal_ranks, prompt_tokens, latencies = [], [], [], []
+    retriever = vector_store.as_retriever(search_kwargs={"k": k})
+    for question, relevant in labeled:
+        start = time.perf_counter()
+        if use_filters:
+            docs, _ = retrieve_documents(retriever, question)
+        else:
+            docs = vector_store.similarity_search(question, k=k)
+        latencies.append(time.perf_counter() - start)
+        recall, reciprocal_rank = score_ranking(docs, relevant, k)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        prompt_tokens.append(sum(estimate_tokens(doc.page_content) for doc in docs))
+    n = len(labeled)
+    return {
+        "recall": sum(recalls) / n,
+        "mrr": sum(reciprocal_ranks) / n,
+        "prompt_tokens": sum(prompt_tokens) / n,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+    }
+
+
+def build_embeddings(args):
+    if args.fake_embeddings:
+        from fakes import FakeEmbeddings
+        return FakeEmbeddings(dim=256, latency=0.0)
+    from langchain_voyageai import VoyageAIEmbeddings
+    return VoyageAIEmbeddings(model="voyage-large-2", voyage_api_key=os.environ["VOYAGE_AI_API_KEY"])
+
+
+def iter_vector_stores(args, embeddings):
+    """Yields (index name, chunk tokens or None, vector store) for every index configuration."""
+    for index_name in args.indexes:
+        if index_name == "local":
+            from fakes import FakeVectorStore
+            chunks = load_staging_chunks(args.staging_dir)
+            for chunk_tokens in args.chunk_tokens:
+                texts, metadatas = rechunk(chunks, chunk_tokens)
+                print(f"Indexing {len(texts)} local chunks at {chunk_tokens} tokens")
+                if args.quantize == "none":
+                    yield index_name, chunk_tokens, FakeVectorStore.from_texts(texts, embeddings, metadatas=metadatas, latency=0.0)
+                else:
+                    from quantized_store import QuantizedVectorStore
+                    yield index_name, chunk_tokens, QuantizedVectorStore.from_texts(
+                        texts, embeddings, metadatas=metadatas, method=args.quantize, rerank=args.rerank
+                    )
+        else:
+            from langchain_pinecone import PineconeVectorStore
+            yield index_name, None, PineconeVectorStore.from_existing_index(index_name=index_name, embedding=embeddings)
+
+
+def print_results(results):
+    print(f"\n{'index':<28}{'chunk':>7}{'k':>4}{'recall@k':>10}{'MRR':>7}{'prompt tok':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in results:
+        chunk = r["chunk_tokens"] if r["chunk_tokens"] is not None else "-"
+        print(f"{r['index']:<28}{chunk:>7}{r['k']:>4}{r['recall']:>10.3f}{r['mrr']:>7.3f}"
+              f"{r['prompt_tokens']:>12.0f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep retriever configurations against a labeled question set.")
+    parser.add_argument("labeled", help="JSONL with `question` and `relevant` (list of content hashes)")
+    parser.add_argument("--indexes", nargs="+", default=["drugbank"],
+                        help="Pinecone index names, and/or `local` for an in-memory index of --staging-dir")
+    parser.add_argument("--staging-dir", default="./staging")
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-tokens", nargs="+", type=int, default=[8000],
+                        help="Chunk sizes to re-split the local index to (8000 matches the ingestion Lambda)")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use the hashing embedder from fakes.py instead of Voyage AI (local index only)")
+    parser.add_argument("--quantize", choices=["none", "int8", "pq"], default="none",
+                        help="Store the local index with quantized_store instead of full-precision vectors")
+    parser.add_argument("--rerank", type=int, default=100,
+                        help="Candidates re-ranked with full-precision vectors when --quantize is set")
+    parser.add_argument("--filters", action="store_true",
+                        help="Pre-filter searches with metadata inferred from each question (metadata_filters.py)")
+    parser.add_argument("--min-recall", type=float, help="Recommend the cheapest configuration at or above this recall")
+    parser.add_argument("--json", help="Write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    labeled = load_labeled_set(args.labeled)
+    embeddings = build_embeddings(args)
+
+    results = []
+    for index_name, chunk_tokens, vector_store in iter_vector_stores(args, embeddings):
+        for k in args.k:
+            result = {"index": index_name, "chunk_tokens": chunk_tokens, "k": k}
+            result.update(evaluate(vector_store, labeled, k, use_filters=args.filters))
+            results.append(result)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.min_recall is not None:
+        eligible = [r for r in results if r["recall"] >= args.min_recall]
+        if not eligible:
+            print(f"\nNo configuration reaches recall {args.min_recall}")
+            return 1
+        best = min(eligible, key=lambda r: (r["prompt_tokens"], r["p95_ms"]))
+        print(f"\nCheapest configuration with recall >= {args.min_recall}: index={best['index']} "
+              f"chunk_tokens={best['chunk_tokens']} k={best['k']} ({best['prompt_tokens']:.0f} prompt tokens)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
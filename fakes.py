@@ -0,0 +1,263 @@
+"""
+Deterministic local stand-ins for the services used by the query path.
+
+These let us run `retrieve_and_format_response` and the conversational
+retrieval chain without OpenAI, Voyage AI, Pinecone or AWS credentials.
+Every fake sleeps for a configurable amount of time so that latency and
+concurrency behave roughly like the real services, and can report each
+simulated call to a `stage_hook(stage, seconds)` callback.
+"""
+import hashlib
+import io
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.vectorstores import VectorStore
+
+from metadata_filters import matches_filter
+
+# Same dimensionality as voyage-large-2
+DEFAULT_EMBEDDING_DIM = 1536
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _tokenize(text):
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def _stable_hash(token):
+    return int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:8], "big")
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers with a canned reply after a simulated delay.
+
+    The delay is `latency` (time to first token) plus `completion_tokens`
+    divided by `tokens_per_second`, which mirrors how a hosted model spends
+    its time on a short answer.
+    """
+
+    latency: float = 0.5
+    tokens_per_second: float = 50.0
+    completion_tokens: int = 60
+    stage_hook: Optional[Callable[[str, float], None]] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        time.sleep(self.latency + self.completion_tokens / self.tokens_per_second)
+
+        # Reply with a deterministic answer so identical prompts give identical output
+        prompt = messages[-1].content if messages else ""
+        digest = hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()[:8]
+        content = " ".join(["answer"] * (self.completion_tokens - 1) + [digest])
+
+        if self.stage_hook:
+            self.stage_hook("llm", time.perf_counter() - start)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashing bag-of-words embedder.
+
+    Texts sharing words get similar vectors, so retrieval over the fake
+    vector store returns sensible neighbours for benchmark queries.
+    """
+
+    def __init__(self, dim=DEFAULT_EMBEDDING_DIM, latency=0.05, stage_hook=None):
+        self.dim = dim
+        self.latency = latency
+        self.stage_hook = stage_hook
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in _tokenize(text):
+            hashed = _stable_hash(token)
+            sign = 1.0 if hashed & 1 else -1.0
+            vector[(hashed >> 1) % self.dim] += sign
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        vectors = [self._embed(text) for text in texts]
+        if self.stage_hook:
+            self.stage_hook("embed", time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeVectorStore(VectorStore):
+    """Brute-force in-memory vector store with a simulated network delay.
+
+    Documents keep their metadata as given, so `metadata['id']` can carry the
+    S3 URI of the staging chunk exactly like the Pinecone index does.
+    """
+
+    def __init__(self, embedding, latency=0.03, stage_hook=None):
+        self._embedding = embedding
+        self.latency = latency
+        self.stage_hook = stage_hook
+        self._texts = []
+        self._metadatas = []
+        self._vectors = []
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        with self._lock:
+            start = len(self._texts)
+            self._texts.extend(texts)
+            self._metadatas.extend(dict(m) for m in metadatas)
+            self._vectors.extend(vectors)
+        return [str(i) for i in range(start, start + len(texts))]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs) -> List[Tuple[Document, float]]:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        metadata_filter = kwargs.get("filter")
+        scored = []
+        for text, metadata, vector in zip(self._texts, self._metadatas, self._vectors):
+            # Pre-filter like Pinecone does: excluded documents are never scored
+            if metadata_filter and not matches_filter(metadata, metadata_filter):
+                continue
+            score = sum(a * b for a, b in zip(embedding, vector))
+            scored.append((score, text, metadata))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        results = [
+            (Document(page_content=text, metadata=dict(metadata)), score)
+            for score, text, metadata in scored[:k]
+        ]
+        if self.stage_hook:
+            self.stage_hook("search", time.perf_counter() - start)
+        return results
+
+    def similarity_search_with_score(self, query, k=4, **kwargs) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Vectors are unit length, so the dot product already is the cosine similarity
+        return lambda score: score
+
+
+class _StreamingBody(io.BytesIO):
+    """Minimal stand-in for botocore's StreamingBody."""
+
+
+class FakeS3Client:
+    """In-memory replacement for the subset of the boto3 S3 client we use."""
+
+    def __init__(self, latency=0.0, sign_latency=0.0, stage_hook=None):
+        self.latency = latency
+        self.sign_latency = sign_latency
+        self.stage_hook = stage_hook
+        self.buckets: Dict[str, Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, bucket, key, body, content_type="binary/octet-stream"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif hasattr(body, "read"):
+            body = body.read()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        with self._lock:
+            self.buckets.setdefault(bucket, {})[key] = {
+                "Body": body,
+                "ETag": etag,
+                "ContentType": content_type,
+                "LastModified": time.time(),
+            }
+        return {"ETag": etag}
+
+    def _lookup(self, bucket, key):
+        try:
+            return self.buckets[bucket][key]
+        except KeyError:
+            raise KeyError(f"NoSuchKey: s3://{bucket}/{key}")
+
+    def put_object(self, Bucket, Key, Body=b"", ContentType="binary/octet-stream", **kwargs):
+        time.sleep(self.latency)
+        return self._store(Bucket, Key, Body, ContentType)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        time.sleep(self.latency)
+        with open(Filename, "rb") as file_data:
+            body = file_data.read()
+        self._store(Bucket, Key, body)
+        if Callback:
+            Callback(len(body))
+
+    def get_object(self, Bucket, Key, **kwargs):
+        time.sleep(self.latency)
+        obj = self._lookup(Bucket, Key)
+        return {
+            "Body": _StreamingBody(obj["Body"]),
+            "ContentType": obj["ContentType"],
+            "ContentLength": len(obj["Body"]),
+            "ETag": obj["ETag"],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        time.sleep(self.latency)
+        obj = self._lookup(Bucket, Key)
+        return {"ContentType": obj["ContentType"], "ContentLength": len(obj["Body"]), "ETag": obj["ETag"]}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000, **kwargs):
+        time.sleep(self.latency)
+        keys = sorted(k for k in self.buckets.get(Bucket, {}) if k.startswith(Prefix))
+        start = int(ContinuationToken) if ContinuationToken else 0
+        page = keys[start:start + MaxKeys]
+        response = {
+            "KeyCount": len(page),
+            "IsTruncated": start + MaxKeys < len(keys),
+            "Contents": [
+                {"Key": k, "ETag": self.buckets[Bucket][k]["ETag"], "Size": len(self.buckets[Bucket][k]["Body"])}
+                for k in page
+            ],
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, HttpMethod=None):
+        start = time.perf_counter()
+        time.sleep(self.sign_latency)
+        params = Params or {}
+        bucket, key = params.get("Bucket", ""), params.get("Key", "")
+        signature = hashlib.sha256(f"{ClientMethod}:{bucket}:{key}:{ExpiresIn}".encode("utf-8")).hexdigest()[:16]
+        url = f"https://{bucket}.s3.local/{quote(key)}?X-Amz-Expires={ExpiresIn}&X-Amz-Signature={signature}"
+        if self.stage_hook:
+            self.stage_hook("sign", time.perf_counter() - start)
+        return url
@@ -0,0 +1,178 @@
+"""
+Pre-computed answers for the most common patient questions.
+
+Most traffic is a handful of question shapes ("What is X used for?", "side
+effects of X") asked about the drugs in the corpus. build-faq-index.py answers
+every template for every drug offline, after each ingestion batch, and stores
+the answers here with the content hashes of the chunks they were built from.
+The app looks a question up (exact match after `normalize_query`) before
+running retrieval and the LLM, so these answers come back in milliseconds.
+
+Each template has one canonical question, which is what gets answered, plus
+alternative phrasings that map to the same answer. Answers keep their source
+links as raw `s3://` URIs and are signed when served, because pre-signed URLs
+expire long before the index is rebuilt.
+
+An entry goes stale when its sources change: the rebuild re-runs retrieval for
+each question and regenerates the answer only when the retrieved chunk hashes
+differ, and `invalidate` drops every entry built from a given set of hashes.
+"""
+import json
+import os
+import re
+import time
+
+from request_pool import normalize_query
+
+# template id -> phrasings; the first one is the question that gets answered
+DEFAULT_TEMPLATES = {
+    "uses": [
+        "What is {drug} used for?",
+        "What is {drug}?",
+        "What does {drug} treat?",
+        "{drug} uses",
+    ],
+    "side_effects": [
+        "What are the side effects of {drug}?",
+        "side effects of {drug}",
+        "{drug} side effects",
+        "Does {drug} have side effects?",
+    ],
+    "how_it_works": [
+        "How does {drug} work?",
+        "What is the mechanism of action of {drug}?",
+    ],
+}
+
+# Staging keys end in _{content_hash}.json, see raw_data_processor.py
+CONTENT_HASH_PATTERN = re.compile(r"_([0-9a-f]{8})\.json$")
+S3_URI_PATTERN = re.compile(r"s3://[^\s)\]]+")
+
+
+def load_templates(path=None):
+    if not path:
+        return DEFAULT_TEMPLATES
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def source_hash(metadata):
+    """Content hash of a retrieved chunk, from its metadata or its staging key."""
+    if metadata.get("content_hash"):
+        return metadata["content_hash"]
+    match = CONTENT_HASH_PATTERN.search(str(metadata.get("id", "")))
+    return match.group(1) if match else str(metadata.get("id"))
+
+
+def source_hashes(metadatas):
+    return sorted({source_hash(metadata) for metadata in metadatas})
+
+
+def sign_links(answer, sign):
+    """Replace the raw s3:// URIs in a stored answer with fresh pre-signed URLs."""
+    return S3_URI_PATTERN.sub(lambda match: sign(match.group(0)), answer)
+
+
+class RawS3Links:
+    """Stands in for the S3 client while building, so answers keep `s3://` URIs instead of expiring URLs."""
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600):
+        return f"s3://{Params['Bucket']}/{Params['Key']}"
+
+
+class FaqIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.keys = {}
+        self.built_at = None
+        self._mtime = None
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as file:
+            data = json.load(file)
+        self.entries = data["entries"]
+        self.keys = data["keys"]
+        # Indexes saved before entries listed their own keys
+        if any("keys" not in entry for entry in self.entries.values()):
+            for entry in self.entries.values():
+                entry["keys"] = []
+            for key, entry_id in self.keys.items():
+                if entry_id in self.entries:
+                    self.entries[entry_id]["keys"].append(key)
+        self.built_at = data.get("built_at")
+        self._mtime = os.path.getmtime(self.path)
+
+    def refresh(self):
+        """Reload the index if the file was rebuilt since it was loaded. Cheap enough to call per request."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        self._load()
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def entry_id(template_id, drug):
+        return f"{template_id}:{normalize_query(drug)}"
+
+    def add(self, template_id, drug, phrasings, answer, sources):
+        entry_id = self.entry_id(template_id, drug)
+        self.remove(entry_id)
+        questions = [phrasing.format(drug=drug) for phrasing in phrasings]
+        keys = list(dict.fromkeys(normalize_query(question) for question in questions))
+        self.entries[entry_id] = {
+            "template": template_id,
+            "drug": drug,
+            "question": questions[0],
+            "answer": answer,
+            "source_hashes": source_hashes(sources),
+            "sources": [source.get("id") for source in sources],
+            "built_at": time.time(),
+            # So `remove` only touches this entry's keys instead of scanning all of them
+            "keys": keys,
+        }
+        for key in keys:
+            self.keys[key] = entry_id
+        return entry_id
+
+    def get(self, entry_id):
+        return self.entries.get(entry_id)
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return False
+        for key in entry["keys"]:
+            # A phrasing shared with another entry may point there now
+            if self.keys.get(key) == entry_id:
+                del self.keys[key]
+        return True
+
+    def lookup(self, question):
+        """The stored entry for this question, or None to fall through to the RAG path."""
+        entry_id = self.keys.get(normalize_query(question))
+        return self.entries.get(entry_id) if entry_id else None
+
+    def invalidate(self, changed_hashes):
+        """Drop every entry built from any of `changed_hashes`. Returns the number removed."""
+        changed_hashes = set(changed_hashes)
+        stale = [entry_id for entry_id, entry in self.entries.items() if changed_hashes & set(entry["source_hashes"])]
+        for entry_id in stale:
+            self.remove(entry_id)
+        return len(stale)
+
+    def save(self, path=None):
+        path = path or self.path
+        self.built_at = time.time()
+        # Write to a temporary file first so the app never reads a half-written index
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"built_at": self.built_at, "entries": self.entries, "keys": self.keys}, file)
+        os.replace(tmp_path, path)
+        self._mtime = os.path.getmtime(path)
@@ -0,0 +1,215 @@
+"""
+Federated retrieval over several vector indexes at once.
+
+Our corpora live in different Pinecone indexes (`drugbank`,
+`healthai-vector-embedding`, whatever `vo_index_name` points at), and each
+app could only search one of them. `FederatedRetriever` searches all of them
+in parallel and merges the results into one top-k:
+  - the query is embedded once and the vector is sent to every source
+  - each source gets `timeout` seconds; a slow or failing source is left out
+    of the answer instead of holding it up (its search keeps running in the
+    background and its result is discarded)
+  - each source runs its searches on its own `max_concurrency` threads, so
+    searches stuck on one hung index cannot starve the others; while all of a
+    source's threads are busy it is skipped, like a timed-out source
+  - raw scores are mapped to 0-1 relevance for the metric of each index
+    (cosine, dot product and euclidean indexes use different scales; see
+    `PINECONE_RELEVANCE`), multiplied by an optional per-source weight, then
+    merged. `merge="rrf"` uses reciprocal rank fusion instead, which ignores
+    score scales entirely.
+  - the same chunk found in two sources is returned once
+
+It is a LangChain retriever, so it drops in wherever `vector_store.as_retriever()`
+was used. `search_by_vector` runs the same search for an already embedded query,
+which is how `metadata_filters.retrieve_documents` applies its filter: the
+filter is passed on to every source.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import tracer
+
+RRF_K = 60
+
+# Pinecone scores by index metric, mapped to 0-1 relevance. Cosine and dot product scores are
+# similarities; euclidean scores are squared distances. The dot product and euclidean mappings
+# assume unit-length vectors, which voyage-large-2 produces.
+PINECONE_RELEVANCE = {
+    "cosine": lambda score: (score + 1) / 2,
+    "dotproduct": lambda score: (score + 1) / 2,
+    "euclidean": lambda score: 1 - score / 4,
+}
+
+
+class FederatedSource:
+    """One index (or namespace of an index) to search."""
+
+    def __init__(self, name, vector_store, weight=1.0, search_kwargs=None, max_concurrency=8, relevance=None):
+        self.name = name
+        self.vector_store = vector_store
+        self.weight = weight
+        # score -> 0-1 relevance; defaults to the store's own relevance function
+        self.relevance = relevance or vector_store._select_relevance_score_fn()
+        # e.g. {"namespace": "medlineplus"} for a Pinecone namespace
+        self.search_kwargs = dict(search_kwargs or {})
+        # Match it to the number of questions answered at once (the app's max_concurrent_answers)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"search-{name}")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run `fn` on this source's threads. Returns None instead of queueing when they are all busy."""
+        with self._lock:
+            if self._in_flight >= self.max_concurrency:
+                return None
+            self._in_flight += 1
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def search(self, embedding, k, **kwargs):
+        """Top `k` (Document, relevance in 0-1) for a query vector."""
+        with tracer.span(f"search:{self.name}"):
+            results = self.vector_store.similarity_search_by_vector_with_score(
+                embedding, k=k, **{**self.search_kwargs, **kwargs}
+            )
+        return [(doc, self.relevance(score)) for doc, score in results]
+
+
+def build_pinecone_sources(specs, embedding, max_concurrency=8):
+    """Sources from "index" or "index:namespace" strings, e.g. ["drugbank", "healthai-vector-embedding:medlineplus"].
+
+    Each index's metric is read from Pinecone, because `from_existing_index` assumes cosine.
+    """
+    from langchain_pinecone import PineconeVectorStore
+    from langchain_pinecone._utilities import DistanceStrategy
+    from pinecone import Pinecone
+
+    distance_strategies = {
+        "cosine": DistanceStrategy.COSINE,
+        "dotproduct": DistanceStrategy.MAX_INNER_PRODUCT,
+        "euclidean": DistanceStrategy.EUCLIDEAN_DISTANCE,
+    }
+    client = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
+    metrics = {}
+    sources = []
+    for spec in specs:
+        index_name, _, namespace = spec.strip().partition(":")
+        if index_name not in metrics:
+            metrics[index_name] = client.describe_index(index_name).metric
+        metric = metrics[index_name]
+        vector_store = PineconeVectorStore(
+            index=client.Index(index_name),
+            embedding=embedding,
+            namespace=namespace or None,
+            distance_strategy=distance_strategies[metric],
+        )
+        sources.append(FederatedSource(
+            spec.strip(), vector_store, max_concurrency=max_concurrency, relevance=PINECONE_RELEVANCE[metric]
+        ))
+    return sources
+
+
+def build_retriever(specs, embedding, k=4, timeout=2.0, max_concurrency=8):
+    """Retriever for `vo_index_name`-style specs: a comma-separated string or a list of "index[:namespace]".
+
+    One spec gives a plain Pinecone retriever, several a FederatedRetriever over all of them.
+    """
+    if isinstance(specs, str):
+        specs = specs.split(",")
+    specs = [spec.strip() for spec in specs if spec.strip()]
+    if not specs:
+        raise ValueError("No index names given")
+    sources = build_pinecone_sources(specs, embedding, max_concurrency=max_concurrency)
+    if len(sources) == 1:
+        return sources[0].vector_store.as_retriever(search_kwargs={"k": k})
+    return FederatedRetriever(sources=sources, embedding=embedding, k=k, timeout=timeout)
+
+
+def _dedup_key(doc):
+    return doc.metadata.get("content_hash") or (doc.metadata.get("id"), doc.page_content)
+
+
+class FederatedRetriever(BaseRetriever):
+    sources: List[Any]
+    embedding: Any
+    k: int = 4
+    # Candidates taken from each source before merging
+    fetch_k: Optional[int] = None
+    timeout: float = 2.0
+    merge: str = "score"
+    search_kwargs: Dict[str, Any] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs, _ = self.search_by_vector(self.embedding.embed_query(query))
+        return docs
+
+    def search_by_vector(self, embedding, metadata_filter=None):
+        """Returns (top-k documents, names of the sources that failed or timed out)."""
+        fetch_k = self.fetch_k or self.k
+        kwargs = {key: value for key, value in self.search_kwargs.items() if key != "k"}
+        if metadata_filter:
+            kwargs["filter"] = metadata_filter
+
+        # Each search runs in a copy of our context, so its span lands in the current trace
+        futures, busy = {}, []
+        for source in self.sources:
+            future = source.submit(contextvars.copy_context().run, source.search, embedding, fetch_k, **kwargs)
+            if future is None:
+                busy.append(source.name)
+            else:
+                futures[future] = source
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        span = tracer.current_span()
+        ranked_lists = []
+        failed = busy + [futures[future].name for future in not_done]
+        for future in done:
+            source = futures[future]
+            try:
+                ranked_lists.append((source, future.result()))
+            except Exception as e:
+                print(f"Federated search in {source.name} failed: {e!r}")
+                failed.append(source.name)
+        if busy:
+            print(f"Federated search skipped busy sources: {', '.join(busy)}")
+        if not_done:
+            print(f"Federated search timed out after {self.timeout}s in: {', '.join(futures[f].name for f in not_done)}")
+        span.set_attribute("sources", len(self.sources))
+        span.set_attribute("sources_failed", failed)
+        return self._merge(ranked_lists)[:self.k], failed
+
+    def _merge(self, ranked_lists):
+        best = {}
+        for source, results in ranked_lists:
+            for rank, (doc, relevance) in enumerate(results, start=1):
+                if self.merge == "rrf":
+                    score = source.weight / (RRF_K + rank)
+                else:
+                    score = source.weight * relevance
+                key = _dedup_key(doc)
+                if self.merge == "rrf" and key in best:
+                    # Reciprocal rank fusion rewards chunks that several sources agree on
+                    best[key][0] += score
+                elif key not in best or score > best[key][0]:
+                    doc.metadata["index"] = source.name
+                    best[key] = [score, doc]
+        merged = sorted(best.values(), key=lambda item: item[0], reverse=True)
+        for score, doc in merged:
+            doc.metadata["federated_score"] = score
+        return [doc for _, doc in merged]
@@ -0,0 +1,37 @@
+"""
+Download tiktoken encodings into lambda_functions/tiktoken_cache/ at build time.
+
+Ship the directory in the deployment package (next to raw_data_processor.py)
+and the Lambda loads the BPE files from disk during init instead of
+downloading them from openaipublic.blob.core.windows.net on every cold start.
+
+Example:
+    python lambda_functions/bundle_tiktoken.py
+    cd lambda_functions && zip -r ../ingest.zip raw_data_processor.py tiktoken_cache/
+"""
+import argparse
+import os
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache")
+
+
+def bundle(encodings, cache_dir=DEFAULT_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    # tiktoken writes every file it downloads to TIKTOKEN_CACHE_DIR, under the names it later looks up
+    os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    import tiktoken
+
+    for name in encodings:
+        encoding = tiktoken.get_encoding(name)
+        print(f"Bundled {name} ({encoding.n_vocab} tokens)")
+    files = sorted(os.listdir(cache_dir))
+    size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in files)
+    print(f"{len(files)} files, {size / 1024 / 1024:.1f} MB in {cache_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bundle tiktoken encodings for the ingestion Lambda.")
+    parser.add_argument("encodings", nargs="*", default=["cl100k_base"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+    bundle(args.encodings, args.cache_dir)
@@ -1,33 +1,72 @@
+# Cold starts dominate burst ingestion, so everything done during init is timed
+# and logged as one JSON line (see profile_cold_start.py for a local report)
+import time
+_init_start = time.perf_counter()
+INIT_PROFILE = {}
+
 # Libraries natively supported by AWS Lambda
 import json
 import boto3
-from io import BytesIO
+from io import BytesIO, StringIO
 import hashlib
 import os
+import sys
 import tempfile
 import csv
+import re
+import urllib.parse
 # Libraries below are from added layer(s)
 # import openai
 # import pypdf
+# The PDF stack (langchain_community, pypdf) is only imported for PDF events, see get_pdf_loader
 import tiktoken
-import urllib
-from langchain_community.document_loaders import PyPDFLoader
 
+INIT_PROFILE["imports_ms"] = round(1000 * (time.perf_counter() - _init_start), 1)
 
-print('Loading function')
+# tiktoken reads its BPE files from this directory instead of downloading them.
+# bundle_tiktoken.py fills it at build time; without it tiktoken downloads to /tmp on first use.
+TIKTOKEN_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache")
+if os.path.isdir(TIKTOKEN_CACHE_DIR):
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
 
 # # OpenAI lib setup
 # openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Init s3 client
+_step_start = time.perf_counter()
 s3_client = boto3.client('s3')
+INIT_PROFILE["s3_client_ms"] = round(1000 * (time.perf_counter() - _step_start), 1)
 
 def num_tokens_from_string(string: str, encoding_name="cl100k_base") -> int:
     """Returns the number of tokens in a text string."""
+    # tiktoken keeps loaded encodings in memory, so after the warm-up below this is a lookup
     encoding = tiktoken.get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
+# Warm up the encoder during init (which runs at full CPU) rather than on the first chunk
+_step_start = time.perf_counter()
+try:
+    num_tokens_from_string("warm up")
+except Exception as e:
+    # Not fatal: the first real call will try again
+    print(f"Could not load the tiktoken encoding during init: {e!r}")
+INIT_PROFILE["tiktoken_encoding_ms"] = round(1000 * (time.perf_counter() - _step_start), 1)
+INIT_PROFILE["tiktoken_bundled"] = os.path.isdir(TIKTOKEN_CACHE_DIR)
+
+_pdf_loader = None
+
+def get_pdf_loader():
+    """PyPDFLoader, imported the first time a PDF arrives."""
+    global _pdf_loader
+    if _pdf_loader is None:
+        step_start = time.perf_counter()
+        from langchain_community.document_loaders import PyPDFLoader
+        _pdf_loader = PyPDFLoader
+        print(json.dumps({"event": "lazy_import", "module": "PyPDFLoader",
+                          "ms": round(1000 * (time.perf_counter() - step_start), 1)}))
+    return _pdf_loader
+
 def split_into_chunks(text, count_tokens, max_tokens=8000):
     words = text.split()  # Splitting the text into words
     chunks = []
@@ -56,6 +95,52 @@ def split_into_chunks(text, count_tokens, max_tokens=8000):
 
     return chunks
 
+# Filterable metadata for the vector index, see metadata_filters.py at the repo root.
+# The fields go at the top level of each staging chunk, because Pinecone metadata has to be flat
+# (strings, numbers, booleans and lists of strings); staging_embedder.py copies them as they are.
+# The Lambda is deployed as a single file, so the category keywords are copied here; keep them in sync.
+DRUG_CATEGORIES = [
+    'Analgesics', 'Antibiotics', 'Antifungal Agents', 'Antiviral Agents', 'Antipyretics',
+    'Antiseptics', 'Mood Stabilizers', 'Anti-Inflammatory Agents', 'Anticoagulants',
+    'Antihistamines', 'Diuretics', 'Laxatives', 'Bronchodilators', 'Anticonvulsants',
+    'Antidepressants'
+]
+CATEGORY_KEYWORDS = {
+    'Analgesics': ['analgesic', 'painkiller', 'pain relie', 'opioid'],
+    'Antibiotics': ['antibiotic', 'anti-bacterial', 'antibacterial', 'penicillin', 'cephalosporin', 'bacterial infection'],
+    'Antifungal Agents': ['antifungal', 'anti-fungal', 'fungal infection'],
+    'Antiviral Agents': ['antiviral', 'anti-viral', 'antiretroviral', 'hiv', 'herpes', 'hepatitis', 'influenza'],
+    'Antipyretics': ['antipyretic', 'fever'],
+    'Antiseptics': ['antiseptic', 'disinfect'],
+    'Mood Stabilizers': ['mood stabili', 'bipolar', 'lithium'],
+    'Anti-Inflammatory Agents': ['anti-inflammatory', 'antiinflammatory', 'nsaid', 'inflammation'],
+    'Anticoagulants': ['anticoagulant', 'blood thinner', 'blood clot', 'thrombo'],
+    'Antihistamines': ['antihistamine', 'histamine', 'allerg', 'hay fever'],
+    'Diuretics': ['diuretic', 'water pill'],
+    'Laxatives': ['laxative', 'constipation'],
+    'Bronchodilators': ['bronchodilator', 'asthma', 'copd', 'inhaler'],
+    'Anticonvulsants': ['anticonvulsant', 'antiepileptic', 'seizure', 'epilep'],
+    'Antidepressants': ['antidepressant', 'depression', 'ssri'],
+}
+
+def categories_in_text(text):
+    text = str(text).lower()
+    return [
+        category for category in DRUG_CATEGORIES
+        if any(re.search(r"\b" + re.escape(keyword), text) for keyword in CATEGORY_KEYWORDS[category])
+    ]
+
+def chunk_metadata(file_key, doc_type, text):
+    # The folder under raw/ names the source collection, e.g. raw/drugbank/drugs.csv -> drugbank
+    parts = file_key.split('/')
+    if parts[0] == 'raw':
+        parts = parts[1:]
+    return {
+        "drug_categories": categories_in_text(text),
+        "doc_type": doc_type,
+        "collection": parts[0] if len(parts) > 1 else "general",
+    }
+
 def short_hash(input_string, length=8):
     # Encode the input string to a bytes object
     input_bytes = input_string.encode('utf-8')
@@ -81,7 +166,7 @@ def load_and_parse_pdf(bucket_name, file_key, client=s3_client):
         tmpfile.seek(0) # Go back to the beginning of the file after writing
 
         # Initialize PyPDFLoader with the path to the temporary file
-        loader = PyPDFLoader(file_path=tmpfile.name)
+        loader = get_pdf_loader()(file_path=tmpfile.name)
         # Load and parse the document
         document = loader.load()
 
@@ -103,7 +188,7 @@ def process_structured_data(bucket_name, file_key, client=s3_client):
     }
     
     # Get the object from S3
-    response = s3.get_object(Bucket=copy_source["Bucket"], Key=copy_source["Key"])
+    response = client.get_object(Bucket=copy_source["Bucket"], Key=copy_source["Key"])
     content_type = response['ContentType']
     file_content = response['Body'].read().decode('utf-8')
     
@@ -117,10 +202,11 @@ def process_structured_data(bucket_name, file_key, client=s3_client):
     # Split rows and further process them
     # Initiate a json
     for row in reader:
-        total_token = num_tokens_from_string(row)
+        row_string = json.dumps(row)
+        total_token = num_tokens_from_string(row_string)
         chunk_data = {}
         # Hash the contents of the paragraph
-        file_hash = short_hash(row)
+        file_hash = short_hash(row_string)
         # Format the label with leading zeros
         label = f"staging/{copy_source['Key'].split('.')[0]}_row_data_{file_hash}.json"  # 5 digits with leading zeros, adjust as needed
         # Construct the JSON
@@ -128,13 +214,25 @@ def process_structured_data(bucket_name, file_key, client=s3_client):
         chunk_data["content_hash"] = file_hash
         chunk_data["content"] = row
         chunk_data["token_count"] = total_token
+        # DrugBank exports have their own category column, which is a better signal than the whole row
+        chunk_data.update(chunk_metadata(file_key, "csv_row", row.get("Drug Categories") or row_string))
         # Save to staging
         json_data_string = json.dumps(chunk_data)
-        s3_client.put_object(Bucket=copy_source["Bucket"], Key=label, Body=json_data_string)
+        client.put_object(Bucket=copy_source["Bucket"], Key=label, Body=json_data_string)
     print("Data chunked and saved to staging.")
     return None
 
+INIT_PROFILE["init_ms"] = round(1000 * (time.perf_counter() - _init_start), 1)
+INIT_PROFILE["modules_loaded"] = len(sys.modules)
+print(json.dumps({"event": "init", **INIT_PROFILE}))
+_cold_start = True
+
 def lambda_handler(event, context):
+    # Mark the first invocation of each execution environment, to count cold starts in the logs
+    global _cold_start
+    print(json.dumps({"event": "invocation", "cold_start": _cold_start}))
+    _cold_start = False
+
     # Get the object from the event and show its content type
     bucket = event['Records'][0]['s3']['bucket']['name']
     key_encoded = event['Records'][0]['s3']['object']['key']
@@ -145,10 +243,13 @@ def lambda_handler(event, context):
     print("key: ", key)
     
     # Different processing for different file types 
+    document = None
     if key.lower().endswith(".pdf"):
         document = load_and_parse_pdf(bucket_name=bucket, file_key=key)
+        doc_type = "pdf"
     elif key.lower().endswith(".txt"):
         document = load_raw_text(bucket_name=bucket, file_key=key)
+        doc_type = "txt"
     elif key.lower().endswith(".csv") or key.lower().endswith(".tsv"):
         process_structured_data(bucket_name=bucket, file_key=key)
     else:
@@ -189,6 +290,7 @@ def lambda_handler(event, context):
                 chunk_data["content_hash"] = file_hash
                 chunk_data["content"] = paragraph
                 chunk_data["token_count"] = total_token
+                chunk_data.update(chunk_metadata(key, doc_type, paragraph))
                 # Save to staging
                 print("chunk_data: ", chunk_data["source"])
                 json_data_string = json.dumps(chunk_data)
@@ -209,6 +311,7 @@ def lambda_handler(event, context):
                     chunk_data["content_hash"] = file_hash
                     chunk_data["content"] = chunk
                     chunk_data["token_count"] = num_tokens_from_string(chunk)
+                    chunk_data.update(chunk_metadata(key, doc_type, chunk))
                     # Save to staging
                     json_data_string = json.dumps(chunk_data)
                     s3_client.put_object(Bucket=bucket, Key=label, Body=json_data_string)
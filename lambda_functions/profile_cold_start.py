@@ -0,0 +1,97 @@
+"""
+Import-time and cold-start report for the ingestion Lambda.
+
+Loads the handler module in a fresh Python process, the way a new Lambda
+execution environment does, with `-X importtime`. Prints the slowest imports
+and the init profile the module logs (imports, S3 client, tiktoken warm-up).
+With --pdf it also imports the PDF stack, which PDF events load lazily.
+
+Example:
+    python lambda_functions/profile_cold_start.py --runs 5 --pdf
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HANDLER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raw_data_processor.py")
+
+
+def run_once(handler, pdf=False):
+    """Returns (init profile dict, {top-level package: cumulative import ms}, wall ms)."""
+    code = (
+        "import time, runpy; start = time.perf_counter(); "
+        f"module = runpy.run_path({handler!r}); "
+        + ("module['get_pdf_loader'](); " if pdf else "")
+        + "print('WALL_MS', 1000 * (time.perf_counter() - start))"
+    )
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    init_profile, lazy, wall_ms = {}, {}, 0.0
+    for line in result.stdout.splitlines():
+        if line.startswith("WALL_MS"):
+            wall_ms = float(line.split()[1])
+        elif line.startswith("{"):
+            record = json.loads(line)
+            if record.get("event") == "init":
+                init_profile = record
+            elif record.get("event") == "lazy_import":
+                lazy[record["module"]] = record["ms"]
+    if lazy:
+        init_profile["lazy_imports_ms"] = lazy
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only top-level entries, the nested ones are already in their parent's cumulative time
+        if name.startswith("  "):
+            continue
+        imports[name.strip()] = imports.get(name.strip(), 0.0) + int(cumulative) / 1000.0
+    return init_profile, imports, wall_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the ingestion Lambda's cold start.")
+    parser.add_argument("--handler", default=HANDLER)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--pdf", action="store_true", help="Also import the PDF stack, as a PDF event does")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.handler, pdf=args.pdf) for _ in range(args.runs)]
+    walls = [wall for _, _, wall in runs]
+    imports = {}
+    for _, run_imports, _ in runs:
+        for name, ms in run_imports.items():
+            imports.setdefault(name, []).append(ms)
+    slowest = sorted(((statistics.median(v), name) for name, v in imports.items()), reverse=True)[:args.top]
+
+    print(f"Cold start over {args.runs} fresh processes: median {statistics.median(walls):.0f} ms, "
+          f"max {max(walls):.0f} ms")
+    print("Init profile (last run):")
+    for key, value in runs[-1][0].items():
+        if key != "event":
+            print(f"  {key}: {value}")
+    print("Slowest top-level imports (median cumulative ms):")
+    for ms, name in slowest:
+        print(f"  {ms:>9.1f}  {name}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"wall_ms": walls, "init_profile": runs[-1][0],
+                       "imports_ms": {name: ms for ms, name in slowest}}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Embeds the staging chunks written by raw_data_processor.py and upserts them into Pinecone.
+# Trigger it with s3:ObjectCreated:* on the staging/ prefix.
+#
+# Each vector's metadata carries the chunk text (`text`, which langchain_pinecone reads back),
+# the staging URI (`id`, which the apps link to) and the filterable fields the ingestion Lambda
+# writes at the top level of the chunk, so metadata_filters.retrieve_documents can pre-filter on them.
+#
+# Environment: VOYAGE_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME (default drugbank),
+# optional PINECONE_NAMESPACE and VOYAGE_MODEL (default voyage-large-2, as the apps query with).
+
+# Libraries natively supported by AWS Lambda
+import json
+import boto3
+import os
+import urllib.parse
+# Libraries below are from added layer(s)
+import voyageai
+from pinecone import Pinecone
+
+# Keep in sync with FILTER_FIELDS in metadata_filters.py at the repo root
+FILTER_FIELDS = ("drug_categories", "doc_type", "collection")
+
+EMBEDDING_MODEL = os.getenv("VOYAGE_MODEL", "voyage-large-2")
+PINECONE_NAMESPACE = os.getenv("PINECONE_NAMESPACE") or None
+
+# Init clients once per execution environment
+s3_client = boto3.client('s3')
+voyage_client = voyageai.Client(api_key=os.getenv("VOYAGE_API_KEY"))
+pinecone_index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(os.getenv("PINECONE_INDEX_NAME", "drugbank"))
+
+def chunk_text(chunk):
+    # CSV rows are stored as dicts, everything else as plain text
+    return chunk["content"] if isinstance(chunk["content"], str) else json.dumps(chunk["content"])
+
+def pinecone_metadata(chunk, staging_uri):
+    metadata = {
+        "text": chunk_text(chunk),
+        "id": staging_uri,
+        "source": chunk["source"],
+        "content_hash": chunk["content_hash"],
+    }
+    for field in FILTER_FIELDS:
+        # Chunks staged before the fields were added are upserted without them
+        if chunk.get(field) is not None:
+            metadata[field] = chunk[field]
+    return metadata
+
+def lambda_handler(event, context):
+    # One batch per event: a single embedding call and a single upsert
+    ids, texts, metadatas = [], [], []
+    for record in event['Records']:
+        bucket = record['s3']['bucket']['name']
+        key = urllib.parse.unquote_plus(record['s3']['object']['key'])
+        if not key.endswith(".json"):
+            print(f"Skipping {key}, not a staging chunk.")
+            continue
+        chunk = json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        staging_uri = "s3://"+bucket+"/"+key
+        ids.append(key)
+        texts.append(chunk_text(chunk))
+        metadatas.append(pinecone_metadata(chunk, staging_uri))
+
+    if not ids:
+        return "No staging chunks to embed."
+
+    embeddings = voyage_client.embed(texts, model=EMBEDDING_MODEL, input_type="document").embeddings
+    pinecone_index.upsert(
+        vectors=[
+            {"id": vector_id, "values": values, "metadata": metadata}
+            for vector_id, values, metadata in zip(ids, embeddings, metadatas)
+        ],
+        namespace=PINECONE_NAMESPACE,
+    )
+    print(f"Upserted {len(ids)} chunks: {', '.join(ids)}")
+    return f"Upserted {len(ids)} chunks."
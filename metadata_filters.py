@@ -0,0 +1,164 @@
+"""
+Metadata pre-filters for vector search.
+
+The ingestion Lambda tags every staging chunk with these top-level fields
+(`FILTER_FIELDS`)
+  - `drug_categories`: the entries of `DRUG_CATEGORIES` the chunk mentions
+  - `doc_type`: `pdf`, `txt` or `csv_row`
+  - `collection`: the folder under `raw/` the file was uploaded to (e.g. `drugbank`)
+and the embedding step (lambda_functions/staging_embedder.py) stores them as
+Pinecone metadata next to `id` and `text`.
+
+`infer_filter` reads the same signals from a question and builds a Pinecone
+metadata filter, and `retrieve_documents` runs the search with it, so a
+question about antibiotics only searches antibiotic chunks. When a filtered
+search finds nothing (an untagged corpus, or a wrong guess) it falls back to
+the unfiltered search with the same query vector, so a miss costs one extra
+search but no extra embedding call. A federated search that came back empty
+because sources failed or timed out is not repeated unfiltered: it would only
+wait for the same sources again.
+
+`matches_filter` evaluates the same filter syntax locally for the in-memory
+stores (fakes.py, quantized_store.py).
+"""
+import re
+
+# Filterable chunk fields, stored flat because Pinecone metadata cannot hold nested objects
+FILTER_FIELDS = ("drug_categories", "doc_type", "collection")
+
+# Same list as `distinct_drug_categories` in data-gathering.ipynb
+DRUG_CATEGORIES = [
+    'Analgesics', 'Antibiotics', 'Antifungal Agents', 'Antiviral Agents', 'Antipyretics',
+    'Antiseptics', 'Mood Stabilizers', 'Anti-Inflammatory Agents', 'Anticoagulants',
+    'Antihistamines', 'Diuretics', 'Laxatives', 'Bronchodilators', 'Anticonvulsants',
+    'Antidepressants'
+]
+
+# Word stems that point to each category, in DrugBank text and in patient questions.
+# Keep in sync with CATEGORY_KEYWORDS in lambda_functions/raw_data_processor.py
+CATEGORY_KEYWORDS = {
+    'Analgesics': ['analgesic', 'painkiller', 'pain relie', 'opioid'],
+    'Antibiotics': ['antibiotic', 'anti-bacterial', 'antibacterial', 'penicillin', 'cephalosporin', 'bacterial infection'],
+    'Antifungal Agents': ['antifungal', 'anti-fungal', 'fungal infection'],
+    'Antiviral Agents': ['antiviral', 'anti-viral', 'antiretroviral', 'hiv', 'herpes', 'hepatitis', 'influenza'],
+    'Antipyretics': ['antipyretic', 'fever'],
+    'Antiseptics': ['antiseptic', 'disinfect'],
+    'Mood Stabilizers': ['mood stabili', 'bipolar', 'lithium'],
+    'Anti-Inflammatory Agents': ['anti-inflammatory', 'antiinflammatory', 'nsaid', 'inflammation'],
+    'Anticoagulants': ['anticoagulant', 'blood thinner', 'blood clot', 'thrombo'],
+    'Antihistamines': ['antihistamine', 'histamine', 'allerg', 'hay fever'],
+    'Diuretics': ['diuretic', 'water pill'],
+    'Laxatives': ['laxative', 'constipation'],
+    'Bronchodilators': ['bronchodilator', 'asthma', 'copd', 'inhaler'],
+    'Anticonvulsants': ['anticonvulsant', 'antiepileptic', 'seizure', 'epilep'],
+    'Antidepressants': ['antidepressant', 'depression', 'ssri'],
+}
+
+# Only explicit mentions narrow the document type or collection
+DOC_TYPE_KEYWORDS = {
+    'pdf': ['pdf', 'leaflet', 'brochure'],
+    'csv_row': ['spreadsheet', 'csv', 'table row'],
+}
+COLLECTION_KEYWORDS = {
+    'drugbank': ['drugbank'],
+    'medlineplus': ['medlineplus', 'medline plus'],
+}
+
+
+def _mentions(text, keywords):
+    # Match at word starts so "hiv" does not match inside "archive"
+    return any(re.search(r"\b" + re.escape(keyword), text) for keyword in keywords)
+
+
+def categories_in_text(text):
+    """Every drug category the text mentions, in `DRUG_CATEGORIES` order."""
+    text = str(text).lower()
+    return [category for category in DRUG_CATEGORIES if _mentions(text, CATEGORY_KEYWORDS[category])]
+
+
+def infer_filter(query):
+    """Pinecone metadata filter for the question, or None when nothing narrows it down."""
+    text = query.lower()
+    clauses = []
+    categories = categories_in_text(text)
+    if categories:
+        clauses.append({"drug_categories": {"$in": categories}})
+    for field, table in (("doc_type", DOC_TYPE_KEYWORDS), ("collection", COLLECTION_KEYWORDS)):
+        values = [value for value, keywords in table.items() if _mentions(text, keywords)]
+        if values:
+            clauses.append({field: {"$in": values}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _matches_condition(value, condition):
+    # Pinecone treats a list field as matching when any element matches
+    values = value if isinstance(value, list) else [value]
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = operand in values
+        elif operator == "$ne":
+            ok = operand not in values
+        elif operator == "$in":
+            ok = any(v in operand for v in values)
+        elif operator == "$nin":
+            ok = not any(v in operand for v in values)
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches_filter(metadata, metadata_filter):
+    """Evaluates a Pinecone-style metadata filter against one document's metadata."""
+    if not metadata_filter:
+        return True
+    for field, condition in metadata_filter.items():
+        if field == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif field not in metadata or not _matches_condition(metadata[field], condition):
+            return False
+    return True
+
+
+def _vector_search(retriever):
+    """(embedding model, search(vector, filter) -> (documents, failed sources)), or None when the retriever can't search by vector."""
+    if hasattr(retriever, "search_by_vector"):
+        # FederatedRetriever
+        return retriever.embedding, retriever.search_by_vector
+    vector_store = getattr(retriever, "vectorstore", None)
+    if vector_store is None or getattr(retriever, "search_type", None) != "similarity":
+        return None
+
+    def search(embedding, metadata_filter=None):
+        kwargs = dict(retriever.search_kwargs)
+        if metadata_filter:
+            kwargs["filter"] = metadata_filter
+        return [doc for doc, _ in vector_store.similarity_search_by_vector_with_score(embedding, **kwargs)], []
+
+    return vector_store.embeddings, search
+
+
+def retrieve_documents(retriever, query, use_filters=True):
+    """Returns (documents, filter used or None), pre-filtering the search when the question allows it."""
+    metadata_filter = infer_filter(query) if use_filters else None
+    vector_search = _vector_search(retriever) if metadata_filter else None
+    if vector_search is None:
+        return retriever.get_relevant_documents(query), None
+
+    # Embed the question once; the unfiltered fallback reuses the vector
+    embedding_model, search = vector_search
+    embedding = embedding_model.embed_query(query)
+    docs, failed = search(embedding, metadata_filter)
+    if docs or failed:
+        return docs, metadata_filter
+    docs, _ = search(embedding)
+    return docs, None
@@ -0,0 +1,23 @@
+"""
+Answer prompts, shared so that answers generated offline (batch-qa.py,
+build-faq-index.py) read like the ones the apps generate live.
+
+Each is a `str.format` / `ChatPromptTemplate` template with the fields
+`query`, `s3_gen_url` (the link to attach) and `combined_content` (the
+retrieved chunks).
+"""
+
+# `utils.retrieve_and_format_response`
+SUMMARY_PROMPT = "Instruction: Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
+    Only respond with the information relevant to the user query {query}, if there are none, make sure you say 'I don't know, I did not find the relevant data in the knowledge base.' \
+    In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
+    Context: {combined_content}"
+
+# simple-app.py and chat-rag-url.py
+PATIENT_EDUCATION_PROMPT = "Instruction: You are a helpful assistant to help users with their patient education queries. \
+    Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
+    Only respond with the information relevant to the user query {query}, \
+    if there are none, make sure you say the `magic words`: 'I don't know, I did not find the relevant data in the knowledge base.' \
+    But you could carry out some conversations with the user to make them feel welcomed and comfortable, in that case you don't have to say the `magic words`. \
+    In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
+    Context: {combined_content}"
@@ -0,0 +1,284 @@
+"""
+Compact on-disk storage for embedding vectors, for local search and caching.
+
+voyage-large-2 vectors are 1536 float32 values (6 KB each). `QuantizedIndex`
+stores them either as
+  - int8 scalar codes (per-dimension min/max), 1 byte per dimension (4x smaller), or
+  - product quantization codes, 1 byte per subspace (e.g. 96 subspaces: 64x smaller),
+and scores queries against the codes directly (asymmetric distance: the query
+stays in float32). The best candidates can then be re-ranked with the
+full-precision vectors, which are only read for those rows.
+
+Every array is a plain .npy file opened with `mmap_mode="r"`, so several
+worker processes share one copy through the page cache.
+
+A `QuantizedVectorStore` directory holds one generation per build
+(`gen-*/`, the index files plus `docs.jsonl`) and a `current` symlink to the
+live one. `add_texts` builds a new generation next to it and swaps the link
+with `os.replace`, so a reader never sees half-written files, and arrays it
+already mapped are never rewritten underneath it.
+
+`QuantizedVectorStore` wraps an index as a LangChain vector store, so it can
+stand in for Pinecone wherever we only need a local copy of the corpus.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from metadata_filters import matches_filter
+
+INDEX_FILE = "index.json"
+DOCS_FILE = "docs.jsonl"
+CURRENT_LINK = "current"
+
+# Rows scored per block; small blocks keep the float32 copy of the int8 codes in cache
+BLOCK_SIZE = 1024
+
+
+def _kmeans(data, n_clusters, iterations=20, seed=0):
+    """Plain Lloyd's k-means, enough to train PQ codebooks."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        # ||x - c||^2 without the ||x||^2 term, which does not change the argmin
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * data @ centroids.T
+        assignment = distances.argmin(axis=1)
+        for c in range(n_clusters):
+            members = data[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                # Re-seed empty clusters so every code gets used
+                centroids[c] = data[rng.integers(len(data))]
+    return centroids
+
+
+class QuantizedIndex:
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as file:
+            self.meta = json.load(file)
+        mode = "r" if mmap else None
+        self.method = self.meta["method"]
+        self.dim = self.meta["dim"]
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode=mode)
+        if self.method == "int8":
+            self.scale = np.load(os.path.join(path, "scale.npy"))
+            self.offset = np.load(os.path.join(path, "offset.npy"))
+        else:
+            self.codebooks = np.load(os.path.join(path, "codebooks.npy"))
+        full_path = os.path.join(path, "vectors.npy")
+        self.vectors = np.load(full_path, mmap_mode=mode) if os.path.exists(full_path) else None
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @classmethod
+    def build(cls, vectors, path, method="int8", pq_subspaces=None, pq_iterations=20,
+              pq_train_size=65536, keep_full=True, seed=0):
+        """Quantize `vectors` (n x dim) into `path` and return the loaded index.
+
+        `pq_subspaces` defaults to one subspace per 16 dimensions (96 for voyage-large-2).
+        """
+        if method not in ("int8", "pq"):
+            raise ValueError(f"Unknown quantization method: {method}")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        os.makedirs(path, exist_ok=True)
+        meta = {"method": method, "dim": dim, "count": n}
+
+        if method == "int8":
+            low, high = vectors.min(axis=0), vectors.max(axis=0)
+            scale = np.maximum(high - low, 1e-12) / 255.0
+            codes = np.round((vectors - low) / scale) - 128
+            np.save(os.path.join(path, "codes.npy"), codes.astype(np.int8))
+            np.save(os.path.join(path, "scale.npy"), scale.astype(np.float32))
+            # Reconstruction is codes * scale + offset
+            np.save(os.path.join(path, "offset.npy"), (low + 128 * scale).astype(np.float32))
+        else:
+            pq_subspaces = pq_subspaces or max(dim // 16, 1)
+            if dim % pq_subspaces:
+                raise ValueError(f"Dimension {dim} is not divisible into {pq_subspaces} subspaces")
+            sub_dim = dim // pq_subspaces
+            rng = np.random.default_rng(seed)
+            train = vectors[rng.choice(n, min(n, pq_train_size), replace=False)]
+            codebooks = np.zeros((pq_subspaces, 256, sub_dim), dtype=np.float32)
+            # Stored subspace-major (m x n), so scoring reads each subspace's codes contiguously
+            codes = np.zeros((pq_subspaces, n), dtype=np.uint8)
+            for j in range(pq_subspaces):
+                sub = slice(j * sub_dim, (j + 1) * sub_dim)
+                centroids = _kmeans(train[:, sub], 256, iterations=pq_iterations, seed=seed + j)
+                codebooks[j, :len(centroids)] = centroids
+                for start in range(0, n, BLOCK_SIZE):
+                    block = vectors[start:start + BLOCK_SIZE, sub]
+                    distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * block @ centroids.T
+                    codes[j, start:start + BLOCK_SIZE] = distances.argmin(axis=1)
+            np.save(os.path.join(path, "codes.npy"), codes)
+            np.save(os.path.join(path, "codebooks.npy"), codebooks)
+            meta["pq_subspaces"] = pq_subspaces
+
+        if keep_full:
+            np.save(os.path.join(path, "vectors.npy"), vectors)
+        with open(os.path.join(path, INDEX_FILE), "w") as file:
+            json.dump(meta, file)
+        return cls(path)
+
+    def approximate_scores(self, query):
+        """Inner product of `query` with every stored vector, computed from the codes."""
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(len(self), dtype=np.float32)
+        if self.method == "int8":
+            weights = query * self.scale
+            bias = float(query @ self.offset)
+            for start in range(0, len(self), BLOCK_SIZE):
+                block = self.codes[start:start + BLOCK_SIZE]
+                scores[start:start + len(block)] = block.astype(np.float32) @ weights + bias
+        else:
+            m = self.codebooks.shape[0]
+            # Lookup table of query . centroid for every subspace, then sum over the codes
+            table = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(m, -1))
+            scores[:] = 0.0
+            for j in range(m):
+                scores += table[j].take(self.codes[j])
+        return scores
+
+    def search(self, query, k=10, rerank=100, mask=None):
+        """Returns (row indices, scores) of the top `k` rows, best first.
+
+        The top `max(k, rerank)` approximate results are re-scored with the
+        full-precision vectors when the index kept them. `mask` (one bool per
+        row) restricts the search to the rows where it is True.
+        """
+        eligible = len(self) if mask is None else int(np.count_nonzero(mask))
+        if eligible == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        scores = self.approximate_scores(query)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        candidates = min(max(k, rerank if self.vectors is not None else k), eligible)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if self.vectors is not None and rerank:
+            # Sorted indices keep reads from the memory map sequential
+            top = np.sort(top)
+            candidate_scores = self.vectors[top] @ np.asarray(query, dtype=np.float32)
+        else:
+            candidate_scores = scores[top]
+        order = np.argsort(-candidate_scores)[:k]
+        return top[order], candidate_scores[order]
+
+    @property
+    def nbytes(self):
+        """Bytes needed for search without re-ranking (the codes and their tables)."""
+        extra = self.scale.nbytes + self.offset.nbytes if self.method == "int8" else self.codebooks.nbytes
+        return self.codes.nbytes + extra
+
+
+def _resolve(path):
+    """Directory holding the live generation; stores written before generations keep their files in `path`."""
+    link = os.path.join(path, CURRENT_LINK)
+    return os.path.realpath(link) if os.path.islink(link) else path
+
+
+def _write_generation(path, vectors, texts, metadatas, method, **kwargs):
+    """Build a complete index and docs file in a new directory under `path`."""
+    generation = tempfile.mkdtemp(prefix="gen-", dir=path)
+    # mkdtemp makes it private to this user; other worker processes need to read it
+    os.chmod(generation, 0o755)
+    QuantizedIndex.build(vectors, generation, method=method, **kwargs)
+    with open(os.path.join(generation, DOCS_FILE), "w", encoding="utf-8") as file:
+        for text, metadata in zip(texts, metadatas):
+            file.write(json.dumps({"text": text, "metadata": metadata}) + "\n")
+    return generation
+
+
+def _publish(path, generation):
+    """Point `current` at `generation` in one atomic rename, then delete all but the previous generation."""
+    previous = _resolve(path)
+    tmp_link = os.path.join(path, CURRENT_LINK + ".tmp")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(generation), tmp_link)
+    os.replace(tmp_link, os.path.join(path, CURRENT_LINK))
+    # The previous generation is kept until the next build, for readers that are still opening it
+    keep = {os.path.realpath(generation), os.path.realpath(previous)}
+    for name in os.listdir(path):
+        full_path = os.path.join(path, name)
+        if name.startswith("gen-") and os.path.realpath(full_path) not in keep:
+            shutil.rmtree(full_path, ignore_errors=True)
+
+
+class QuantizedVectorStore(VectorStore):
+    """LangChain vector store over a `QuantizedIndex` plus the document texts and metadata."""
+
+    def __init__(self, embedding, path, rerank=100, mmap=True):
+        self._embedding = embedding
+        self.path = path
+        self.rerank = rerank
+        self._mmap = mmap
+        directory = _resolve(path)
+        self.index = QuantizedIndex(directory, mmap=mmap)
+        self._texts, self._metadatas = [], []
+        with open(os.path.join(directory, DOCS_FILE), encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                self._texts.append(record["text"])
+                self._metadatas.append(record["metadata"])
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, path=None, method="int8", rerank=100, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        path = path or tempfile.mkdtemp(prefix="quantized-store-")
+        os.makedirs(path, exist_ok=True)
+        _publish(path, _write_generation(path, embedding.embed_documents(texts), texts, metadatas, method, **kwargs))
+        return cls(embedding, path, rerank=rerank)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        # Codes depend on the whole corpus (value ranges, codebooks), so adding means rebuilding
+        if self.index.vectors is None:
+            raise ValueError("This index was built without full-precision vectors and cannot be extended")
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.vstack([self.index.vectors, np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)])
+        start = len(self._texts)
+        all_texts, all_metadatas = self._texts + texts, self._metadatas + list(metadatas)
+        options = {"pq_subspaces": self.index.meta["pq_subspaces"]} if self.index.method == "pq" else {}
+        # Build the new generation aside; the files this index has mapped are left untouched
+        generation = _write_generation(self.path, vectors, all_texts, all_metadatas, self.index.method, **options)
+        _publish(self.path, generation)
+        self.index = QuantizedIndex(generation, mmap=self._mmap)
+        self._texts, self._metadatas = all_texts, all_metadatas
+        return [str(i) for i in range(start, len(self._texts))]
+
+    def _filter_mask(self, metadata_filter):
+        if not metadata_filter:
+            return None
+        return np.array([matches_filter(metadata, metadata_filter) for metadata in self._metadatas], dtype=bool)
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        mask = self._filter_mask(kwargs.get("filter"))
+        rows, scores = self.index.search(embedding, k=k, rerank=kwargs.get("rerank", self.rerank), mask=mask)
+        return [
+            (Document(page_content=self._texts[row], metadata=dict(self._metadatas[row])), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # voyage-large-2 vectors are unit length, so the inner product is the cosine similarity
+        return lambda score: score
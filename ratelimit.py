@@ -0,0 +1,197 @@
+"""
+Token-bucket rate limiting for calls to the hosted providers (OpenAI, Voyage AI).
+
+A `RateLimiter` combines a requests-per-minute bucket and a tokens-per-minute
+bucket, matching the way both providers publish their limits. The
+`RateLimitedChatModel` and `RateLimitedEmbeddings` wrappers apply a limiter in
+front of the LangChain objects we already use, so the retrieval and answer
+code does not need to change. `retry_with_backoff` retries only the errors
+that can succeed on a later attempt (`is_retryable`).
+"""
+import random
+import threading
+import time
+from typing import Any, Iterator
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, amount=1.0):
+        """Take `amount` tokens if available; returns the seconds to wait otherwise (0 on success)."""
+        # A request larger than the bucket could never be admitted, so cap it
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount=1.0, timeout=None):
+        """Block until `amount` tokens are available. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Per-provider limits expressed the way providers publish them (per minute)."""
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute / 60.0, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.requests and not self.requests.acquire(1, timeout=timeout):
+            return False
+        if self.tokens and tokens:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            if not self.tokens.acquire(tokens, timeout=remaining):
+                return False
+        return True
+
+
+_tokenizer_failed = False
+
+
+def estimate_tokens(text):
+    """Token estimate for rate limiting; uses tiktoken when it is available."""
+    global _tokenizer_failed
+    if not _tokenizer_failed:
+        try:
+            from tracing import num_tokens_from_string
+            return num_tokens_from_string(text)
+        except Exception:
+            # Don't pay for a failing encoding download on every call
+            _tokenizer_failed = True
+    # Roughly four characters per token for English text
+    return max(len(text) // 4, 1)
+
+
+# Exception class names the provider SDKs (openai, voyageai, httpx, requests, botocore) use for transient failures
+_RETRYABLE_NAMES = ("RateLimit", "Throttl", "Timeout", "Connection", "ServiceUnavailable", "ServerError",
+                    "InternalServer", "TryAgain")
+
+
+def _status_code(error):
+    for status in (getattr(error, "status_code", None), getattr(error, "http_status", None),
+                   getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(status, int):
+            return status
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        # botocore's ClientError
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return None
+
+
+def is_retryable(error):
+    """True for rate limits (429), server errors (5xx), timeouts and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(marker in cls.__name__ for cls in type(error).__mro__ for marker in _RETRYABLE_NAMES)
+
+
+def retry_with_backoff(fn, retries=5, base_delay=1.0, max_delay=60.0, on_retry=None, retryable=is_retryable):
+    """Call `fn()`; on a retryable exception wait with exponential backoff and full jitter, then try again.
+
+    Anything else (bad requests, auth errors, bugs) is raised straight away, since trying
+    again would only fail the same way while holding a worker.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if on_retry:
+                on_retry(attempt + 1, e, delay)
+            time.sleep(delay)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Chat model that waits for its rate limiter before every call to the wrapped model.
+
+    It is a LangChain chat model itself, so every entry point (`llm(messages)`,
+    `invoke`, `batch`, `stream`, the async variants and `prompt | llm` chains)
+    ends up in `_generate` or `_stream` and goes through the limiter.
+    """
+
+    llm: BaseChatModel
+    limiter: Any
+    completion_tokens: int = 256
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, llm, limiter, completion_tokens=256, **kwargs):
+        super().__init__(llm=llm, limiter=limiter, completion_tokens=completion_tokens, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.llm._llm_type}"
+
+    def _acquire(self, messages):
+        text = " ".join(str(message.content) for message in messages)
+        self.limiter.acquire(estimate_tokens(text) + self.completion_tokens)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._acquire(messages)
+        return self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if type(self.llm)._stream is BaseChatModel._stream:
+            # The wrapped model cannot stream, so send its whole answer as one chunk
+            message = self._generate(messages, stop=stop, run_manager=run_manager, **kwargs).generations[0].message
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content))
+            return
+        self._acquire(messages)
+        yield from self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embeddings wrapper that waits for its rate limiter before every call."""
+
+    def __init__(self, embeddings, limiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+
+    def embed_documents(self, texts):
+        self.limiter.acquire(sum(estimate_tokens(text) for text in texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.limiter.acquire(estimate_tokens(text))
+        return self.embeddings.embed_query(text)
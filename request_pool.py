@@ -0,0 +1,116 @@
+"""
+Shared execution layer for answering questions from many concurrent sessions.
+
+When a question spikes (a medication recall in the news), every Streamlit
+session used to run its own retrieval and LLM call at the same moment, and
+they all hit the provider limits together. `RequestPool` puts one layer in
+front of that work:
+  - single flight: identical questions (after `normalize_query`) that are
+    already in flight join the running request and share its answer, instead
+    of starting another one
+  - a bounded worker pool caps how many answers are computed at once; the
+    rate limiters from ratelimit.py pace the provider calls made inside it
+  - a bounded queue: when it is full `submit` raises `PoolFull` straight away,
+    so the UI can say "busy, try again" instead of timing out or failing on 429s
+
+The pool only coalesces requests that are running or queued; it is not a cache.
+"""
+import contextvars
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from tracing import tracer
+
+
+class PoolFull(Exception):
+    """Raised by `RequestPool.submit` when the queue is at capacity."""
+
+
+def normalize_query(query):
+    """Key under which identical questions are coalesced: case, spacing and trailing punctuation ignored."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+
+class Ticket:
+    """Handle for a submitted question."""
+
+    def __init__(self, future, coalesced, queued_ahead):
+        self.future = future
+        # True when this request joined an identical one already in flight
+        self.coalesced = coalesced
+        # Requests waiting for a worker when this one was admitted
+        self.queued_ahead = queued_ahead
+
+    def result(self, timeout=None):
+        return self.future.result(timeout=timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class RequestPool:
+    def __init__(self, max_workers=8, max_queue=64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="request-pool")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._queued = 0
+        self.stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool, or join the in-flight call with the same key."""
+        with self._lock:
+            self.stats["submitted"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                # A joined request is a hit in the `coalesce` cache metrics
+                tracer.record_cache("coalesce", True)
+                return Ticket(future, coalesced=True, queued_ahead=self._queued)
+            if self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise PoolFull(f"{self._queued} requests already waiting")
+            queued_ahead = self._queued
+            self._queued += 1
+            future = Future()
+            self._in_flight[key] = future
+        tracer.record_cache("coalesce", False)
+
+        # Run in the caller's context so request traces and benchmark timings follow the work
+        context = contextvars.copy_context()
+
+        def run():
+            with self._lock:
+                self._queued -= 1
+            try:
+                result = context.run(fn, *args, **kwargs)
+            except BaseException as e:
+                self._finish(key, future, "failed")
+                future.set_exception(e)
+            else:
+                self._finish(key, future, "completed")
+                future.set_result(result)
+
+        self._executor.submit(run)
+        return Ticket(future, coalesced=False, queued_ahead=queued_ahead)
+
+    def _finish(self, key, future, outcome):
+        # Drop the key before publishing the result, so later identical questions start fresh
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            self.stats[outcome] += 1
+
+    def run(self, key, fn, *args, timeout=None, **kwargs):
+        """Submit and wait for the result."""
+        return self.submit(key, fn, *args, **kwargs).result(timeout=timeout)
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return self._queued
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -12,17 +12,28 @@ import time
 import re
 from langchain_pinecone import PineconeVectorStore
 from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage
+from langchain.schema import AIMessage, HumanMessage
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import ConversationChain
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 import uuid
 import warnings
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from tracing import tracer, TracedEmbeddings
+from metadata_filters import retrieve_documents
+from prompts import PATIENT_EDUCATION_PROMPT
+from ratelimit import RateLimiter, RateLimitedChatModel, RateLimitedEmbeddings, retry_with_backoff
+from request_pool import RequestPool, PoolFull, normalize_query
+from federated_retriever import build_retriever
+from faq_index import FaqIndex, sign_links
 
 # Ignore all warnings
 warnings.filterwarnings("ignore")
 
+# The `magic words` the prompt asks for when the knowledge base has nothing relevant
+NOT_FOUND_ANSWER = "I don't know, I did not find the relevant data in the knowledge base."
+
 # Set up Streamlit app
 st.set_page_config(page_title="Custom Chatbot", layout="wide")
 st.title("Custom Chatbot with Retrieval Abilities")
@@ -40,33 +51,70 @@ def generate_presigned_url(s3_uri):
     return presigned_url
 
 # Function to retrieve documents, generate URLs, and format the response
-def retrieve_and_format_response(query, retriever, llm):
-    docs = retriever.get_relevant_documents(query)
-    
-    formatted_docs = []
-    for doc in docs:
-        content_data = doc.page_content
-        s3_uri = doc.metadata['id']
-        s3_gen_url = generate_presigned_url(s3_uri)
-        formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
-        formatted_docs.append(formatted_doc)
-    
-    combined_content = "\n\n".join(formatted_docs)
-    
-    # Create a prompt for the LLM to generate an explanation based on the retrieved content
-    prompt = f"Instruction: You are a helpful assistant to help users with their patient education queries. \
-               Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
-               Only respond with the information relevant to the user query {query}, \
-               if there are none, make sure you say the `magic words`: 'I don't know, I did not find the relevant data in the knowledge base.' \
-               But you could carry out some conversations with the user to make them feel welcomed and comfortable, in that case you don't have to say the `magic words`. \
-               In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
-               Context: {combined_content}"
-    
-    # Originally there were no message
-    message = HumanMessage(content=prompt)
+def retrieve_and_format_response(query, retriever, llm, use_filters=True):
+    with tracer.trace("retrieve_and_format_response"):
+        with tracer.span("retrieve") as span:
+            # Narrow the search with metadata inferred from the question
+            docs, metadata_filter = retrieve_documents(retriever, query, use_filters=use_filters)
+            span.set_attribute("documents", len(docs))
+            span.set_attribute("filtered", metadata_filter is not None)
+        
+        # Nothing to build an answer from (e.g. every index timed out), so don't ask the LLM
+        if not docs:
+            return AIMessage(content=NOT_FOUND_ANSWER)
+        
+        formatted_docs = []
+        with tracer.span("sign", urls=len(docs)):
+            for doc in docs:
+                content_data = doc.page_content
+                s3_uri = doc.metadata['id']
+                s3_gen_url = generate_presigned_url(s3_uri)
+                formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
+                formatted_docs.append(formatted_doc)
+        
+        with tracer.span("prompt") as span:
+            combined_content = "\n\n".join(formatted_docs)
+            
+            # Create a prompt for the LLM to generate an explanation based on the retrieved content
+            prompt = PATIENT_EDUCATION_PROMPT.format(query=query, s3_gen_url=s3_gen_url, combined_content=combined_content)
+            
+            # Originally there were no message
+            message = HumanMessage(content=prompt)
+            span.count_tokens("prompt_tokens", prompt)
+
+        with tracer.span("llm") as span:
+            response = llm([message])
+            span.count_tokens("completion_tokens", response.content)
+        return response
+
+# Shared by every session in this server process (Streamlit re-runs the script per interaction)
+@st.cache_resource
+def get_execution_layer(max_workers, max_queue, openai_rpm, openai_tpm, voyage_rpm, voyage_tpm):
+    request_pool = RequestPool(max_workers=max_workers, max_queue=max_queue)
+    llm_limiter = RateLimiter("openai", requests_per_minute=openai_rpm, tokens_per_minute=openai_tpm)
+    embed_limiter = RateLimiter("voyage", requests_per_minute=voyage_rpm, tokens_per_minute=voyage_tpm)
+    return request_pool, llm_limiter, embed_limiter
 
-    response = llm([message])
-    return response
+# Pre-computed answers from build-faq-index.py, reloaded whenever the file is rebuilt
+@st.cache_resource
+def get_faq_index(path):
+    return FaqIndex(path)
+
+# Pinecone handles and the per-index search pools, built once per server process rather than on every rerun
+@st.cache_resource
+def get_retriever(index_spec, voyage_api_key, timeout, max_concurrency, _embed_limiter):
+    # VOYAGE AI
+    model_name = "voyage-large-2"
+    # Wrapped so query embedding time shows up in the request traces
+    embedding_function = TracedEmbeddings(RateLimitedEmbeddings(VoyageAIEmbeddings(
+        model=model_name,
+        voyage_api_key=voyage_api_key
+    ), _embed_limiter))
+    return build_retriever(index_spec, embedding_function, timeout=timeout, max_concurrency=max_concurrency)
+
+def answer_question(query):
+    # The limiters pace requests, and the backoff absorbs the occasional 429 that still gets through
+    return retry_with_backoff(lambda: retrieve_and_format_response(query, retriever, llm).content, retries=3)
 
 # Function to save chat history to a file
 def save_chat_history_to_file(filename, history):
@@ -109,21 +157,28 @@ aws_secret_access_key = st.secrets["aws_secret_access_key"]
 aws_region = st.secrets["aws_region"]
 vo_index_name = st.secrets["vo_index_name"]
 
+# Concurrency and provider limits, shared by all sessions; match them to your API tiers
+request_pool, llm_limiter, embed_limiter = get_execution_layer(
+    max_workers=st.secrets.get("max_concurrent_answers", 8),
+    max_queue=st.secrets.get("max_queued_answers", 64),
+    openai_rpm=st.secrets.get("openai_rpm", 500),
+    openai_tpm=st.secrets.get("openai_tpm", 30000),
+    voyage_rpm=st.secrets.get("voyage_rpm", 300),
+    voyage_tpm=st.secrets.get("voyage_tpm", 1000000),
+)
+# Seconds a question may wait for a worker before we give up on it
+answer_timeout = st.secrets.get("answer_timeout", 120)
+
+faq_index = get_faq_index(st.secrets.get("faq_index_path", "faq_index.json"))
+faq_index.refresh()
+
 # Langchain stuff
-llm = ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY)
+llm = RateLimitedChatModel(ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY), llm_limiter)
 
 # Initialize the conversation memory
 memory = ConversationBufferMemory()
 
-prompt_template = ChatPromptTemplate.from_template(
-        "Instruction: You are a helpful assistant to help users with their patient education queries. \
-        Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
-        Only respond with the information relevant to the user query {query}, \
-        if there are none, make sure you say the `magic words`: 'I don't know, I did not find the relevant data in the knowledge base.' \
-        But you could carry out some conversations with the user to make them feel welcomed and comfortable, in that case you don't have to say the `magic words`. \
-        In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
-        Context: {combined_content}"
-    )
+prompt_template = ChatPromptTemplate.from_template(PATIENT_EDUCATION_PROMPT)
 
 # Initialize necessary objects (s3 client, Pinecone, OpenAI, etc.)
 s3_client = boto3.client(
@@ -139,18 +194,15 @@ index_name = vo_index_name
 openai.api_key = OPENAI_API_KEY
 
 # Set up LangChain objects
-# VOYAGE AI
-model_name = "voyage-large-2"  
-embedding_function = VoyageAIEmbeddings(
-    model=model_name,  
-    voyage_api_key=VOYAGE_AI_API_KEY
-)
-# Initialize the Pinecone client
-vector_store = PineconeVectorStore.from_existing_index(
-    embedding=embedding_function,
-    index_name=index_name
+# `vo_index_name` may list several indexes ("drugbank,healthai-vector-embedding:medlineplus"),
+# which are then searched in parallel and merged
+retriever = get_retriever(
+    index_name,
+    VOYAGE_AI_API_KEY,
+    timeout=st.secrets.get("federated_timeout", 2.0),
+    max_concurrency=st.secrets.get("max_concurrent_answers", 8),
+    _embed_limiter=embed_limiter,
 )
-retriever = vector_store.as_retriever()
 
 # Initialize rag_chain
 rag_chain = (
@@ -180,8 +232,32 @@ if user_input:
         st.markdown(user_input)
     
     # Generate and display bot response
-    with st.spinner("Thinking..."):
-        bot_response = retrieve_and_format_response(user_input, retriever, llm).content
+    # Common questions are answered from the pre-computed index, with freshly signed links
+    faq_entry = faq_index.lookup(user_input)
+    tracer.record_cache("faq", faq_entry is not None)
+    if faq_entry is not None:
+        ticket = None
+        bot_response = sign_links(faq_entry["answer"], generate_presigned_url)
+    else:
+        # Identical questions already being answered for another session share that answer
+        try:
+            ticket = request_pool.submit(normalize_query(user_input), answer_question, user_input)
+        except PoolFull:
+            ticket = None
+            bot_response = "We're answering a lot of questions right now. Please try again in a minute."
+    if ticket is not None:
+        if ticket.coalesced:
+            st.caption("Someone just asked the same question, sharing that answer.")
+        elif ticket.queued_ahead:
+            st.caption(f"{ticket.queued_ahead} questions ahead of yours, hang tight.")
+        with st.spinner("Thinking..."):
+            try:
+                bot_response = ticket.result(timeout=answer_timeout)
+            except FuturesTimeoutError:
+                bot_response = "This is taking longer than usual. Please try again in a minute."
+            except Exception as e:
+                print(f"Failed to answer {user_input!r}: {e!r}")
+                bot_response = "Sorry, something went wrong while answering. Please try again."
     
     st.session_state["messages"].append({"role": "assistant", "content": bot_response})
     
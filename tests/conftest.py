@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules under test live at the repo root and in data-processing/, neither of which is a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, "data-processing"))
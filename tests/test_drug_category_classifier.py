@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+from drug_category_classifier import DrugCategoryClassifier, chunk_list
+from fakes import FakeEmbeddings
+
+CATEGORIES = ["Analgesics", "Antibiotics", "Antihistamines", "Diuretics"]
+
+
+class RecordingEmbedder:
+    """Embeds with the bag-of-words fake and records every batch it is asked for."""
+
+    def __init__(self):
+        self.embeddings = FakeEmbeddings(dim=256, latency=0.0)
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return self.embeddings.embed_documents(texts)
+
+    @property
+    def texts(self):
+        return [text for batch in self.batches for text in batch]
+
+
+def test_chunk_list_respects_size_and_token_limits():
+    assert list(chunk_list(["a", "b", "c"], 2, 100)) == [["a", "b"], ["c"]]
+    assert list(chunk_list(["a b", "c d", "e"], 10, 3)) == [["a b"], ["c d", "e"]]
+
+
+def test_category_matrix_is_cached_on_disk_and_reused(tmp_path):
+    cache_path = str(tmp_path / "category_embeddings.json")
+    first_embedder = RecordingEmbedder()
+    first = DrugCategoryClassifier(first_embedder, CATEGORIES, cache_path=cache_path)
+    assert first_embedder.texts == CATEGORIES
+    with open(cache_path, encoding="utf-8") as file:
+        assert json.load(file)["categories"] == CATEGORIES
+
+    second_embedder = RecordingEmbedder()
+    second = DrugCategoryClassifier(second_embedder, CATEGORIES, cache_path=cache_path)
+    assert second_embedder.batches == [] and second.api_calls == 0
+    np.testing.assert_allclose(second.category_matrix, first.category_matrix)
+
+
+@pytest.mark.parametrize("categories, model", [(CATEGORIES[:3], "voyage-large-2"), (CATEGORIES, "voyage-2")])
+def test_cache_is_ignored_for_other_categories_or_models(tmp_path, categories, model):
+    cache_path = str(tmp_path / "category_embeddings.json")
+    DrugCategoryClassifier(RecordingEmbedder(), CATEGORIES, cache_path=cache_path)
+    embedder = RecordingEmbedder()
+    DrugCategoryClassifier(embedder, categories, cache_path=cache_path, model=model)
+    assert embedder.texts == categories
+
+
+def test_classify_embeds_each_distinct_description_once():
+    embedder = RecordingEmbedder()
+    classifier = DrugCategoryClassifier(embedder, CATEGORIES, batch_size=2)
+    embedder.batches.clear()
+    descriptions = ["Antibiotics, Penicillins", "Diuretics", "Antibiotics, Penicillins", "Diuretics", "Analgesics, Opioids"]
+    assert classifier.classify(descriptions) == ["Antibiotics", "Diuretics", "Antibiotics", "Diuretics", "Analgesics"]
+    assert embedder.texts == ["Antibiotics, Penicillins", "Diuretics", "Analgesics, Opioids"]
+    # Three distinct descriptions in batches of two
+    assert len(embedder.batches) == 2
+    assert classifier.scores([]).shape == (0, len(CATEGORIES))
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from faq_index import DEFAULT_TEMPLATES, FaqIndex, sign_links
+
+SOURCES = [{"id": "s3://bucket/staging/drugbank/aspirin_parag_00000_1a2b3c4d.json"}]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FaqIndex(str(tmp_path / "faq_index.json"))
+
+
+def test_lookup_matches_every_phrasing(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "Pain relief.", SOURCES)
+    for question in ["What is Aspirin used for?", "what is aspirin used for", "  ASPIRIN uses. "]:
+        assert index.lookup(question)["answer"] == "Pain relief."
+    assert index.lookup("What is ibuprofen used for?") is None
+    assert index.get("uses:aspirin")["source_hashes"] == ["1a2b3c4d"]
+
+
+def test_add_replaces_the_previous_answer(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "Old.", SOURCES)
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"][:1], "New.", SOURCES)
+    assert len(index) == 1
+    assert index.lookup("What is aspirin used for?")["answer"] == "New."
+    # Phrasings dropped from the template no longer match
+    assert index.lookup("aspirin uses") is None
+
+
+def test_remove_only_drops_its_own_keys(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "Pain relief.", SOURCES)
+    index.add("side_effects", "Aspirin", DEFAULT_TEMPLATES["side_effects"], "Stomach upset.", SOURCES)
+    assert index.remove("uses:aspirin")
+    assert not index.remove("uses:aspirin")
+    assert index.lookup("What is aspirin used for?") is None
+    assert index.lookup("aspirin side effects")["answer"] == "Stomach upset."
+    assert set(index.keys.values()) == {"side_effects:aspirin"}
+
+
+def test_remove_keeps_a_shared_phrasing_that_moved_to_another_entry(index):
+    index.add("uses", "Aspirin", ["What is {drug}?"], "Pain relief.", SOURCES)
+    index.add("how_it_works", "Aspirin", ["How does {drug} work?", "What is {drug}?"], "COX inhibitor.", SOURCES)
+    index.remove("uses:aspirin")
+    assert index.lookup("What is aspirin?")["answer"] == "COX inhibitor."
+
+
+def test_save_and_reload(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "See s3://bucket/raw/aspirin.txt", SOURCES)
+    index.save()
+    reloaded = FaqIndex(index.path)
+    entry = reloaded.lookup("aspirin uses")
+    assert sign_links(entry["answer"], lambda uri: "https://signed") == "See https://signed"
+    assert reloaded.remove("uses:aspirin")
+    assert reloaded.keys == {}
+
+
+def test_loads_indexes_saved_without_per_entry_keys(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "Pain relief.", SOURCES)
+    index.save()
+    with open(index.path, encoding="utf-8") as file:
+        data = json.load(file)
+    for entry in data["entries"].values():
+        del entry["keys"]
+    with open(index.path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    reloaded = FaqIndex(index.path)
+    assert reloaded.remove("uses:aspirin")
+    assert reloaded.keys == {}
+
+
+def test_invalidate_drops_entries_built_from_changed_chunks(index):
+    index.add("uses", "Aspirin", DEFAULT_TEMPLATES["uses"], "Pain relief.", SOURCES)
+    index.add("uses", "Ibuprofen", DEFAULT_TEMPLATES["uses"], "Fever.", [{"content_hash": "ffff0000"}])
+    assert index.invalidate(["1a2b3c4d"]) == 1
+    assert index.lookup("What is aspirin used for?") is None
+    assert index.lookup("What is ibuprofen used for?") is not None
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from medlineplus_crawler import CrawlState, crawl, run
+
+ARTICLE = "<html><h1>Asthma</h1><div class='section'>A disease that inflames the airways.</div></html>"
+ETAG = '"v1"'
+
+
+class ArticleServer:
+    """Serves article 000001 with an ETag, 404s everything else, and records every request."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.requests.append((request.match_info["article_id"], time.monotonic(), request.headers.get("If-None-Match")))
+        try:
+            await asyncio.sleep(self.latency)
+            if request.match_info["article_id"] != "000001":
+                return web.Response(status=404)
+            if request.headers.get("If-None-Match") == ETAG:
+                return web.Response(status=304)
+            return web.Response(text=ARTICLE, content_type="text/html", headers={"ETag": ETAG})
+        finally:
+            self.in_flight -= 1
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/ency/article/{article_id}.htm", self.handle)
+        return app
+
+
+def crawl_with_server(server, coroutine_fn):
+    async def main():
+        async with TestServer(server.app()) as test_server:
+            return await coroutine_fn(str(test_server.make_url("/ency/article/")))
+    return asyncio.run(main())
+
+
+def crawl_args(out, base_url, start=0, end=3, concurrency=2, delay=0.0):
+    return SimpleNamespace(out=str(out), state=None, start=start, end=end, base_url=base_url,
+                           concurrency=concurrency, delay=delay, recheck_missing=False)
+
+
+def test_second_crawl_sends_the_etag_and_skips_known_missing_ids(tmp_path):
+    server = ArticleServer()
+
+    async def crawl_twice(base_url):
+        first = await run(crawl_args(tmp_path, base_url))
+        first_requests = list(server.requests)
+        server.requests.clear()
+        return first, first_requests, await run(crawl_args(tmp_path, base_url))
+
+    first, first_requests, second = crawl_with_server(server, crawl_twice)
+    assert first == {"new": 1, "changed": 0, "unchanged": 0, "missing": 2, "error": 0}
+    assert sorted(article_id for article_id, _, _ in first_requests) == ["000000", "000001", "000002"]
+    assert (tmp_path / "Asthma.txt").read_text(encoding="utf-8").startswith("Name: Asthma\nDefinition: A disease")
+
+    assert second == {"new": 0, "changed": 0, "unchanged": 1, "missing": 2, "error": 0}
+    # Only the known article is requested again, conditionally, and comes back 304
+    assert [(article_id, etag) for article_id, _, etag in server.requests] == [("000001", ETAG)]
+    state = CrawlState(str(tmp_path / ".crawl_state.json"))
+    assert [entry["status"] for _, entry in sorted(state.entries.items())] == [404, 304, 404]
+
+
+def test_requests_to_one_host_are_bounded_and_spaced_out(tmp_path):
+    server = ArticleServer(latency=0.05)
+    crawl_with_server(server, lambda base_url: run(crawl_args(tmp_path, base_url, end=6, concurrency=1, delay=0.05)))
+    assert len(server.requests) == 6
+    assert server.max_in_flight == 1
+    starts = [started for _, started, _ in server.requests]
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.05 - 0.01
+
+
+def test_state_is_only_recorded_once_the_article_is_handled(tmp_path):
+    state = CrawlState(str(tmp_path / "state.json"))
+
+    async def crawl_and_fail(base_url):
+        articles = crawl(["000001"], state, base_url=base_url, delay=0.0)
+        try:
+            async for article_id, status, disease_info in articles:
+                assert status == "new"
+                # As if writing the article file failed
+                raise OSError("disk full")
+        finally:
+            await articles.aclose()
+
+    with pytest.raises(OSError):
+        crawl_with_server(ArticleServer(), crawl_and_fail)
+    # No ETag was stored, so the next run fetches the article again in full
+    assert state.entries == {}
+    assert CrawlState(state.path).entries == {}
@@ -0,0 +1,72 @@
+import pytest
+
+from fakes import FakeEmbeddings, FakeVectorStore
+from metadata_filters import infer_filter, matches_filter, retrieve_documents
+
+METADATA = {"drug_categories": ["Analgesics", "Antipyretics"], "doc_type": "txt", "collection": "drugbank"}
+
+
+@pytest.mark.parametrize("metadata_filter, expected", [
+    (None, True),
+    ({}, True),
+    ({"doc_type": "txt"}, True),
+    ({"doc_type": {"$eq": "pdf"}}, False),
+    ({"doc_type": {"$ne": "pdf"}}, True),
+    # A list field matches when any of its elements does
+    ({"drug_categories": {"$in": ["Antipyretics", "Antibiotics"]}}, True),
+    ({"drug_categories": {"$in": ["Antibiotics"]}}, False),
+    ({"drug_categories": {"$nin": ["Analgesics"]}}, False),
+    ({"$and": [{"doc_type": "txt"}, {"collection": {"$in": ["drugbank"]}}]}, True),
+    ({"$and": [{"doc_type": "txt"}, {"collection": "medlineplus"}]}, False),
+    ({"$or": [{"doc_type": "pdf"}, {"collection": "drugbank"}]}, True),
+    ({"paragraph_id": "00001"}, False),
+])
+def test_matches_filter(metadata_filter, expected):
+    assert matches_filter(METADATA, metadata_filter) is expected
+
+
+def test_matches_filter_rejects_unknown_operators():
+    with pytest.raises(ValueError):
+        matches_filter(METADATA, {"doc_type": {"$regex": "t.t"}})
+
+
+def test_infer_filter():
+    assert infer_filter("Which painkiller is safe?") == {"drug_categories": {"$in": ["Analgesics"]}}
+    assert infer_filter("What is in the archive?") is None
+    assert infer_filter("antibiotic leaflet") == {
+        "$and": [{"drug_categories": {"$in": ["Antibiotics"]}}, {"doc_type": {"$in": ["pdf"]}}]
+    }
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def retriever():
+    embeddings = CountingEmbeddings(dim=64, latency=0)
+    store = FakeVectorStore.from_texts(
+        ["Aspirin is an analgesic.", "Amoxicillin is an antibiotic."],
+        embeddings,
+        metadatas=[{"id": "a", "drug_categories": ["Analgesics"]}, {"id": "b", "drug_categories": ["Antibiotics"]}],
+    )
+    store.latency = 0
+    embeddings.queries = 0
+    return store.as_retriever(search_kwargs={"k": 2})
+
+
+def test_retrieve_documents_pre_filters(retriever):
+    docs, metadata_filter = retrieve_documents(retriever, "Which painkiller should I take?")
+    assert [doc.metadata["id"] for doc in docs] == ["a"]
+    assert metadata_filter == {"drug_categories": {"$in": ["Analgesics"]}}
+
+
+def test_retrieve_documents_falls_back_with_the_same_embedding(retriever):
+    docs, metadata_filter = retrieve_documents(retriever, "Which antidepressant should I take?")
+    assert len(docs) == 2
+    assert metadata_filter is None
+    assert retriever.vectorstore.embeddings.queries == 1
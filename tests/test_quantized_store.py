@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from fakes import FakeEmbeddings
+from quantized_store import QuantizedIndex, QuantizedVectorStore, _publish, _write_generation
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Unit vectors around 50 topics, and queries near some of them, from a fixed seed."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(50, 64))
+    vectors = centers[rng.integers(50, size=3000)] + 0.5 * rng.normal(size=(3000, 64))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(3000, 50, replace=False)] + 0.1 * rng.normal(size=(50, 64))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def recall_at_10(index, vectors, queries, rerank):
+    hits = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:10])
+        rows, _ = index.search(query, k=10, rerank=rerank)
+        hits += len(exact & set(rows))
+    return hits / (10 * len(queries))
+
+
+def test_int8_codes_reconstruct_within_half_a_step(corpus, tmp_path):
+    vectors, _ = corpus
+    index = QuantizedIndex.build(vectors, str(tmp_path))
+    assert index.codes.dtype == np.int8 and index.codes.shape == vectors.shape
+    reconstructed = index.codes.astype(np.float32) * index.scale + index.offset
+    assert np.all(np.abs(reconstructed - vectors) <= index.scale / 2 + 1e-6)
+    assert index.nbytes < vectors.nbytes / 3
+
+
+def test_pq_codes_are_one_byte_per_subspace(corpus, tmp_path):
+    vectors, _ = corpus
+    index = QuantizedIndex.build(vectors, str(tmp_path), method="pq", pq_subspaces=8, pq_iterations=10)
+    assert index.codes.dtype == np.uint8 and index.codes.shape == (8, len(vectors))
+    assert index.codebooks.shape == (8, 256, 8)
+    # Approximate scores track the exact inner products
+    exact = vectors @ vectors[0]
+    assert np.corrcoef(index.approximate_scores(vectors[0]), exact)[0, 1] > 0.9
+
+
+def test_pq_subspaces_must_divide_the_dimension(corpus, tmp_path):
+    with pytest.raises(ValueError):
+        QuantizedIndex.build(corpus[0], str(tmp_path), method="pq", pq_subspaces=7)
+
+
+@pytest.mark.parametrize("method, min_recall_without_rerank", [("int8", 0.9), ("pq", 0.2)])
+def test_recall_at_10_and_the_rerank_gain(corpus, tmp_path, method, min_recall_without_rerank):
+    vectors, queries = corpus
+    index = QuantizedIndex.build(vectors, str(tmp_path), method=method, pq_subspaces=8, pq_iterations=10)
+    approximate = recall_at_10(index, vectors, queries, rerank=0)
+    reranked = recall_at_10(index, vectors, queries, rerank=100)
+    assert approximate >= min_recall_without_rerank
+    assert reranked >= 0.97
+    assert reranked >= approximate
+
+
+def test_search_honours_the_mask(corpus, tmp_path):
+    vectors, queries = corpus
+    index = QuantizedIndex.build(vectors, str(tmp_path))
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[::10] = True
+    rows, _ = index.search(queries[0], k=10, mask=mask)
+    assert len(rows) == 10 and all(row % 10 == 0 for row in rows)
+    assert len(index.search(queries[0], mask=np.zeros(len(vectors), dtype=bool))[0]) == 0
+
+
+def test_reader_opened_mid_swap_keeps_a_consistent_generation(tmp_path):
+    embedding = FakeEmbeddings(dim=64, latency=0.0)
+    path = str(tmp_path / "store")
+    texts = [f"drug {i} treats condition {i}" for i in range(20)]
+    store = QuantizedVectorStore.from_texts(texts, embedding, path=path)
+
+    # The next generation is fully written but not yet published
+    new_texts = texts + ["aspirin relieves headache pain"]
+    generation = _write_generation(path, embedding.embed_documents(new_texts), new_texts, [{}] * len(new_texts), "int8")
+    old_reader = QuantizedVectorStore(embedding, path)
+    _publish(path, generation)
+    new_reader = QuantizedVectorStore(embedding, path)
+
+    # Each reader sees one whole generation: its codes, vectors and docs agree
+    assert len(old_reader.index) == len(old_reader._texts) == 20
+    assert len(new_reader.index) == len(new_reader._texts) == 21
+    assert old_reader.similarity_search("aspirin headache", k=1)[0].page_content in texts
+    assert new_reader.similarity_search("aspirin headache", k=1)[0].page_content == "aspirin relieves headache pain"
+    # The generation the old reader mapped survives the swap
+    assert os.path.isdir(old_reader.index.path)
+    assert store.similarity_search("drug 3 treats condition 3", k=1)[0].page_content == texts[3]
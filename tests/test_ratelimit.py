@@ -0,0 +1,101 @@
+import time
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+
+from fakes import FakeChatModel
+from ratelimit import RateLimitedChatModel, TokenBucket, is_retryable, retry_with_backoff
+
+
+def test_token_bucket_allows_a_burst_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=100, capacity=1)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0.0
+    time.sleep(0.02)
+    assert bucket.try_acquire() == 0.0
+
+
+def test_token_bucket_caps_requests_larger_than_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.try_acquire(10) == 0.0
+
+
+def test_token_bucket_acquire_times_out():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    assert bucket.acquire()
+    start = time.monotonic()
+    assert not bucket.acquire(timeout=0.05)
+    assert time.monotonic() - start < 1.0
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(400), False),
+    (StatusError(401), False),
+    (RateLimitError(), True),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (ValueError(), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_retry_with_backoff_retries_transient_errors_only():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(429)
+        return "ok"
+
+    assert retry_with_backoff(flaky, retries=5, base_delay=0) == "ok"
+    assert len(attempts) == 3
+
+    attempts.clear()
+
+    def broken():
+        attempts.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        retry_with_backoff(broken, retries=5, base_delay=0)
+    assert len(attempts) == 1
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.calls = 0
+
+    def acquire(self, tokens=0, timeout=None):
+        self.calls += 1
+        return True
+
+
+def test_rate_limited_chat_model_limits_every_entry_point():
+    limiter = CountingLimiter()
+    llm = RateLimitedChatModel(FakeChatModel(latency=0, completion_tokens=3), limiter)
+    chain = ChatPromptTemplate.from_template("Tell me about {drug}") | llm
+
+    assert chain.invoke({"drug": "aspirin"}).content
+    assert len(chain.batch([{"drug": "aspirin"}, {"drug": "ibuprofen"}])) == 2
+    assert "".join(chunk.content for chunk in llm.stream("hello"))
+    assert limiter.calls == 4
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from request_pool import PoolFull, RequestPool, normalize_query
+
+
+@pytest.fixture
+def pool():
+    pool = RequestPool(max_workers=1, max_queue=1)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+def blocking(started, release, value="answer"):
+    started.set()
+    assert release.wait(5)
+    return value
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  What is   Aspirin used for?! ") == "what is aspirin used for"
+
+
+def test_identical_questions_share_one_call(pool):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        return blocking(started, release)
+
+    first = pool.submit("q", answer)
+    second = pool.submit("q", answer)
+    assert not first.coalesced
+    assert second.coalesced
+    release.set()
+    assert first.result(timeout=5) == second.result(timeout=5) == "answer"
+    assert len(calls) == 1
+    assert pool.stats["coalesced"] == 1
+
+
+def test_submit_raises_pool_full_when_the_queue_is_at_capacity(pool):
+    started, release = threading.Event(), threading.Event()
+    running = pool.submit("a", blocking, started, release)
+    assert started.wait(5)
+    queued = pool.submit("b", blocking, threading.Event(), release)
+    assert queued.queued_ahead == 0
+    with pytest.raises(PoolFull):
+        pool.submit("c", blocking, threading.Event(), release)
+    # Joining a question already in flight needs no queue slot
+    assert pool.submit("b", blocking, threading.Event(), release).coalesced
+    release.set()
+    assert running.result(timeout=5) == queued.result(timeout=5) == "answer"
+    assert pool.stats["rejected"] == 1
+
+
+def test_key_is_released_after_a_failure(pool):
+    def fail():
+        raise RuntimeError("provider down")
+
+    with pytest.raises(RuntimeError):
+        pool.run("q", fail, timeout=5)
+    # The next identical question starts a fresh call instead of joining the failed one
+    ticket = pool.submit("q", lambda: "recovered")
+    assert not ticket.coalesced
+    assert ticket.result(timeout=5) == "recovered"
+    assert pool.stats["failed"] == 1
+    assert pool.stats["completed"] == 1
@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+import pytest
+
+import s3_bulk_upload
+from fakes import FakeS3Client
+from s3_bulk_upload import CACHE_FILE, EtagCache, local_etag, upload_directory
+
+
+@pytest.fixture
+def directory(tmp_path):
+    (tmp_path / "drugbank").mkdir()
+    (tmp_path / "drugbank" / "aspirin.txt").write_text("Name: Aspirin\n", encoding="utf-8")
+    (tmp_path / "drugbank" / "ibuprofen.txt").write_text("Name: Ibuprofen\n", encoding="utf-8")
+    (tmp_path / "vocabulary.csv").write_text("Name,Drug Categories\n", encoding="utf-8")
+    return tmp_path
+
+
+def test_local_etag_matches_s3_for_single_and_multipart_uploads(tmp_path):
+    path = tmp_path / "leaflet.pdf"
+    data = os.urandom(2500)
+    path.write_bytes(data)
+    assert local_etag(str(path)) == f'"{hashlib.md5(data).hexdigest()}"'
+    # Parts of 1000, 1000 and 500 bytes
+    parts = b"".join(hashlib.md5(data[i:i + 1000]).digest() for i in range(0, len(data), 1000))
+    assert local_etag(str(path), chunksize=1000, threshold=1000) == f'"{hashlib.md5(parts).hexdigest()}-3"'
+
+
+def test_second_run_skips_unchanged_files(directory):
+    s3_client = FakeS3Client()
+    first = upload_directory(str(directory), "bucket", s3_client, workers=4)
+    assert (first["uploaded"], first["skipped"], first["failed"]) == (3, 0, 0)
+    assert sorted(s3_client.buckets["bucket"]) == ["raw/drugbank/aspirin.txt", "raw/drugbank/ibuprofen.txt", "raw/vocabulary.csv"]
+
+    (directory / "drugbank" / "aspirin.txt").write_text("Name: Aspirin\nDescription: NSAID\n", encoding="utf-8")
+    second = upload_directory(str(directory), "bucket", s3_client, workers=4)
+    assert (second["uploaded"], second["skipped"]) == (1, 2)
+    assert s3_client.buckets["bucket"]["raw/drugbank/aspirin.txt"]["Body"].endswith(b"NSAID\n")
+
+    forced = upload_directory(str(directory), "bucket", s3_client, workers=4, force=True)
+    assert (forced["uploaded"], forced["skipped"]) == (3, 0)
+
+
+def test_dry_run_uploads_nothing(directory):
+    s3_client = FakeS3Client()
+    summary = upload_directory(str(directory), "bucket", s3_client, dry_run=True)
+    assert summary["uploaded"] == 3
+    assert s3_client.buckets == {}
+    assert not (directory / CACHE_FILE).exists()
+
+
+def test_etag_cache_is_reused_across_runs_until_a_file_changes(directory, monkeypatch):
+    upload_directory(str(directory), "bucket", FakeS3Client())
+    cache = EtagCache(str(directory / CACHE_FILE))
+    assert len(cache.entries) == 3
+
+    hashed = []
+    monkeypatch.setattr(s3_bulk_upload, "local_etag", lambda path: hashed.append(path) or '"changed"')
+    aspirin = str(directory / "drugbank" / "aspirin.txt")
+    ibuprofen = str(directory / "drugbank" / "ibuprofen.txt")
+    assert cache.etag(ibuprofen) == cache.entries[ibuprofen]["etag"]
+    assert hashed == []
+
+    (directory / "drugbank" / "aspirin.txt").write_text("Name: Aspirin, updated\n", encoding="utf-8")
+    assert cache.etag(aspirin) == '"changed"'
+    assert hashed == [aspirin]
+    cache.save()
+    assert EtagCache(cache.path).entries[aspirin]["etag"] == '"changed"'
@@ -0,0 +1,371 @@
+"""
+Per-request tracing and metrics for the RAG pipeline.
+
+Wrap a request in `tracer.trace(...)` and each step in `tracer.span(...)`.
+Finished traces are handed to a background thread, which counts tokens,
+updates the aggregated metrics and writes to the configured exporters, so the
+request path only pays for a few clock reads and a queue put.
+
+Configuration via environment variables:
+    RAG_TRACE_FILE     append every finished trace as a JSON line to this file
+    RAG_METRICS_PORT   serve aggregated metrics on http://localhost:<port>/metrics
+                       (Prometheus text) and /metrics.json
+"""
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import Embeddings
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# Same helper as in lambda_functions/raw_data_processor.py, which the apps can't import
+# (it creates the Lambda's S3 client on import). Keep the two in sync.
+def num_tokens_from_string(string: str, encoding_name="cl100k_base") -> int:
+    """Returns the number of tokens in a text string."""
+    # Imported here so tracing works without tiktoken installed (counts are left empty);
+    # tiktoken keeps loaded encodings in memory, so after the first call this is a lookup
+    import tiktoken
+    encoding = tiktoken.get_encoding(encoding_name)
+    num_tokens = len(encoding.encode(string))
+    return num_tokens
+
+
+def _quantile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "attributes", "token_texts", "_started", "_finished")
+
+    def __init__(self, name, parent_id=None, attributes=None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        # Wall-clock start for the exported trace; durations use the monotonic clock,
+        # so a system clock adjustment mid-request cannot skew them
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._finished = None
+        self.attributes = dict(attributes or {})
+        self.token_texts = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    def count_tokens(self, key, text):
+        # Counting is deferred to the export thread to keep it off the request path
+        if self.token_texts is None:
+            self.token_texts = {}
+        self.token_texts[key] = text
+
+    @property
+    def duration(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": 1000 * self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned when there is no active trace, so callers never need to check."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def count_tokens(self, key, text):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    def __init__(self, name, attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, attributes=attributes)
+        self.spans = [self.root]
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.root.start,
+            "duration_ms": 1000 * self.root.duration,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class MetricsRegistry:
+    """Aggregated span latencies, counters and cache hit rates."""
+
+    def __init__(self, max_samples=2048):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(lambda: deque(maxlen=max_samples))
+        self.counters = defaultdict(float)
+        self.cache = defaultdict(lambda: [0, 0])
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.durations[name].append(seconds)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record_cache(self, name, hit):
+        with self._lock:
+            self.cache[name][0 if hit else 1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+            counters = dict(self.counters)
+            cache = {name: list(counts) for name, counts in self.cache.items()}
+        return {
+            "spans": {
+                name: dict(
+                    count=len(values),
+                    **{f"p{int(q * 100)}_ms": 1000 * _quantile(values, q) for q in QUANTILES}
+                )
+                for name, values in durations.items()
+            },
+            "counters": counters,
+            "cache": {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+                for name, (hits, misses) in cache.items()
+            },
+        }
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = ["# TYPE rag_span_duration_seconds summary"]
+        for name, stats in snapshot["spans"].items():
+            for q in QUANTILES:
+                seconds = stats[f"p{int(q * 100)}_ms"] / 1000
+                lines.append(f'rag_span_duration_seconds{{span="{name}",quantile="{q}"}} {seconds:.6f}')
+            lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {stats["count"]}')
+        lines.append("# TYPE rag_counter_total counter")
+        for name, value in snapshot["counters"].items():
+            lines.append(f'rag_counter_total{{name="{name}"}} {value}')
+        lines.append("# TYPE rag_cache_requests_total counter")
+        for name, stats in snapshot["cache"].items():
+            lines.append(f'rag_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+            lines.append(f'rag_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonlFileExporter:
+    """Appends every finished trace to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, trace_dict):
+        self._file.write(json.dumps(trace_dict) + "\n")
+        self._file.flush()
+
+
+class Tracer:
+    def __init__(self, exporters=None, max_samples=2048):
+        self.exporters = list(exporters or [])
+        self.metrics = MetricsRegistry(max_samples=max_samples)
+        self._current_trace = contextvars.ContextVar("rag_trace", default=None)
+        self._current_span = contextvars.ContextVar("rag_span", default=None)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._token_error_reported = False
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Start a request trace; nests as a plain span if one is already active."""
+        if self._current_trace.get() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+
+        trace = _Trace(name, attributes)
+        trace_token = self._current_trace.set(trace)
+        span_token = self._current_span.set(trace.root)
+        try:
+            yield trace.root
+        except Exception as e:
+            trace.root.set_attribute("error", repr(e))
+            raise
+        finally:
+            trace.root.finish()
+            self._current_span.reset(span_token)
+            self._current_trace.reset(trace_token)
+            self._submit(trace)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        trace = self._current_trace.get()
+        if trace is None:
+            yield _NOOP_SPAN
+            return
+
+        parent = self._current_span.get()
+        span = Span(name, parent_id=parent.span_id if parent else None, attributes=attributes)
+        trace.spans.append(span)
+        token = self._current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_attribute("error", repr(e))
+            raise
+        finally:
+            span.finish()
+            self._current_span.reset(token)
+
+    def current_span(self):
+        return self._current_span.get() or _NOOP_SPAN
+
+    def record_cache(self, name, hit):
+        self.metrics.record_cache(name, hit)
+        self.current_span().set_attribute(f"{name}_cache_hit", hit)
+
+    def _submit(self, trace):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="rag-tracer", daemon=True)
+                    self._worker.start()
+        self._queue.put(trace)
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                self._process(trace)
+            except Exception as e:
+                print(f"Failed to export trace {trace.trace_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, trace):
+        for span in trace.spans:
+            if span.token_texts:
+                for key, text in span.token_texts.items():
+                    tokens = self._count_tokens(text)
+                    span.attributes[key] = tokens
+                    if tokens is not None:
+                        self.metrics.incr(key, tokens)
+                span.token_texts = None
+            self.metrics.observe(span.name, span.duration)
+            documents = span.attributes.get("documents")
+            if documents is not None:
+                self.metrics.incr("documents_retrieved", documents)
+        self.metrics.incr("requests")
+        if self.exporters:
+            trace_dict = trace.to_dict()
+            for exporter in self.exporters:
+                exporter.export(trace_dict)
+
+    def _count_tokens(self, text):
+        # A missing tokenizer (e.g. no network to fetch the BPE file) must not cost us the trace
+        try:
+            return num_tokens_from_string(str(text))
+        except Exception as e:
+            if not self._token_error_reported:
+                print(f"Token counting failed, leaving token counts empty: {e}")
+                self._token_error_reported = True
+            return None
+
+    def flush(self):
+        """Block until every submitted trace has been exported."""
+        if self._worker is not None:
+            self._queue.join()
+
+
+class TracedEmbeddings(Embeddings):
+    """Wraps an embedding model so every call shows up as an `embed` span."""
+
+    def __init__(self, embeddings, tracer=None):
+        self.embeddings = embeddings
+        self.tracer = tracer
+
+    def _tracer(self):
+        # Fall back to the shared module-level tracer
+        return self.tracer or tracer
+
+    def embed_documents(self, texts):
+        with self._tracer().span("embed", texts=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._tracer().span("embed", texts=1):
+            return self.embeddings.embed_query(text)
+
+
+def serve_metrics(tracer, port, host="127.0.0.1"):
+    """Serve the tracer's aggregated metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = tracer.metrics.to_prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body = json.dumps(tracer.metrics.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrapes out of the application output
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="rag-metrics", daemon=True).start()
+    return server
+
+
+def configure_from_env(tracer):
+    trace_file = os.getenv("RAG_TRACE_FILE")
+    if trace_file:
+        tracer.add_exporter(JsonlFileExporter(trace_file))
+    metrics_port = os.getenv("RAG_METRICS_PORT")
+    if metrics_port:
+        serve_metrics(tracer, int(metrics_port))
+    return tracer
+
+
+# Shared tracer used by the frontends and utils
+tracer = configure_from_env(Tracer())
+atexit.register(tracer.flush)
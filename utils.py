@@ -1,14 +1,21 @@
 from imports import *
+from tracing import tracer
+from metadata_filters import retrieve_documents
+from prompts import SUMMARY_PROMPT
+
+# The `magic words` the prompt asks for when the knowledge base has nothing relevant
+NOT_FOUND_ANSWER = "I don't know, I did not find the relevant data in the knowledge base."
 
 # Function to generate pre-signed URL
-def generate_presigned_url(s3_uri):
+def generate_presigned_url(s3_uri, s3_client=None):
     # Parse the S3 URI
     parsed_url = urlparse(s3_uri)
     bucket_name = parsed_url.netloc
     object_key = parsed_url.path.lstrip('/')
     
-    # Create an S3 client
-    s3_client = boto3.client('s3')
+    # Create an S3 client unless the caller already has one
+    if s3_client is None:
+        s3_client = boto3.client('s3')
     
     # Generate a pre-signed URL for the S3 object
     presigned_url = s3_client.generate_presigned_url(
@@ -19,32 +26,44 @@ def generate_presigned_url(s3_uri):
     return presigned_url
 
 # Function to retrieve documents, generate URLs, and format the response
-def retrieve_and_format_response(query, retriever, llm):
-    docs = retriever.get_relevant_documents(query)
-    
-    formatted_docs = []
-    for doc in docs:
-        content_data = doc.page_content
-        s3_uri = doc.metadata['id']
-        s3_gen_url = generate_presigned_url(s3_uri)
-        formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
-        formatted_docs.append(formatted_doc)
-    
-    combined_content = "\n\n".join(formatted_docs)
-    # print(combined_content)
-    
-    # Create a prompt for the LLM to generate an explanation based on the retrieved content
-    prompt = f"Instruction: Based on the following information, provide a summarized & concise explanation using a couple of sentences. \
-               Only respond with the information relevant to the user query {query}, if there are none, make sure you say 'I don't know, I did not find the relevant data in the knowledge base.' \
-               In the event that there's relevant info, make sure to attach the download button at the very end: \n\n[More Info]({s3_gen_url}) \
-               Context: {combined_content}"
-    
-    # Create the messages for the LLM input
-    messages = [HumanMessage(content=prompt)]
-    
-    # Generate the response using the LLM
-    response = llm(messages=messages)
-    return {"answer": response.content}
+def retrieve_and_format_response(query, retriever, llm, s3_client=None, use_filters=True, prompt_template=SUMMARY_PROMPT):
+    with tracer.trace("retrieve_and_format_response"):
+        with tracer.span("retrieve") as span:
+            # Narrow the search with metadata inferred from the question
+            docs, metadata_filter = retrieve_documents(retriever, query, use_filters=use_filters)
+            span.set_attribute("documents", len(docs))
+            span.set_attribute("filtered", metadata_filter is not None)
+        
+        # Nothing to build an answer from (e.g. every index timed out), so don't ask the LLM
+        if not docs:
+            return {"answer": NOT_FOUND_ANSWER, "sources": []}
+        
+        formatted_docs = []
+        with tracer.span("sign", urls=len(docs)):
+            for doc in docs:
+                content_data = doc.page_content
+                s3_uri = doc.metadata['id']
+                s3_gen_url = generate_presigned_url(s3_uri, s3_client=s3_client)
+                formatted_doc = f"{content_data}\n\n[More Info]({s3_gen_url})"
+                formatted_docs.append(formatted_doc)
+        
+        with tracer.span("prompt") as span:
+            combined_content = "\n\n".join(formatted_docs)
+            # print(combined_content)
+            
+            # Create a prompt for the LLM to generate an explanation based on the retrieved content
+            prompt = prompt_template.format(query=query, s3_gen_url=s3_gen_url, combined_content=combined_content)
+            
+            # Create the messages for the LLM input
+            messages = [HumanMessage(content=prompt)]
+            span.count_tokens("prompt_tokens", prompt)
+        
+        # Generate the response using the LLM
+        with tracer.span("llm") as span:
+            response = llm(messages=messages)
+            span.count_tokens("completion_tokens", response.content)
+        # The metadata of the chunks used lets callers track what the answer was built from
+        return {"answer": response.content, "sources": [dict(doc.metadata) for doc in docs]}
 
 # Example usage with memory
 def ask_question(query, llm, docsearch, chain, memory):